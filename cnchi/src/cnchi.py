@@ -459,9 +459,21 @@ class CnchiInit():
         parser.add_argument(
             "-f", "--force", help=_("Runs cnchi even when another instance is running"),
             action="store_true")
+        parser.add_argument(
+            "-i", "--pipelined-install",
+            help=_("Install packages while the rest of them are still being downloaded"),
+            action="store_true")
+        parser.add_argument(
+            "-l", "--lan-cache",
+            help=_("Get packages from this LAN package cache (pacserve) before using mirrors"),
+            action="append")
         parser.add_argument(
             "-n", "--no-check", help=_("Makes checks optional in check screen"),
             action="store_true")
+        parser.add_argument(
+            "-o", "--offline-bundle",
+            help=_("Install using only the packages and databases of this offline bundle"),
+            nargs='?')
         parser.add_argument(
             "-p", "--packagelist", help=_("Install packages referenced by a local XML file"),
             nargs='?')
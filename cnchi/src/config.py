@@ -59,10 +59,15 @@ class Settings():
             'country_name': '',
             'country_code': '',
             'data': '/usr/share/cnchi/data/',
+            'db_snapshot': None,
             'desktop': 'gnome',
             'desktop_ask': True,
             'desktop_manager': 'lightdm',
             'desktops': [],
+            'download_max_connections_per_mirror': 2,
+            'download_max_segments': 4,
+            'download_max_workers': 4,
+            'download_schedule': 'largest_first',
             'enable_alongside': True,
             'encrypt_home': False,
             'f2fs': False,
@@ -97,8 +102,12 @@ class Settings():
             'luks_root_volume': '',
             'luks_root_device': '',
             'network_manager': 'NetworkManager',
+            'offline_bundle': None,
             'pacman_config_file': '/etc/pacman.conf',
             'partition_mode': 'automatic',
+            'peer_cache_discovery': False,
+            'peer_cache_servers': [],
+            'pipelined_install': False,
             'proxies': None,
             'rankmirrors_done': False,
             'rankmirrors_pipe': None,
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# cache_copy.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Copies packages between pacman's cache and the xz cache dirs """
+
+import fcntl
+import logging
+import os
+import queue
+import shutil
+import threading
+
+# ioctl to clone a file (reflink) in btrfs and xfs (from linux/fs.h)
+FICLONE = 0x40049409
+
+# Bytes copied by each copy_file_range/sendfile call
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def hardlink_file(src, dst):
+    """ Hard links src to dst (only works if both are in the same fs) """
+    tmp_dst = dst + '.tmp'
+    try:
+        os.remove(tmp_dst)
+    except OSError:
+        pass
+    os.link(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+
+def reflink_file(src, dst):
+    """ Clones src to dst (copy on write, btrfs and xfs only) """
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def kernel_copy_file(src, dst):
+    """ Copies src to dst inside the kernel (no user space buffers) """
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        src_fd = src_file.fileno()
+        dst_fd = dst_file.fileno()
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(src_fd, dst_fd, CHUNK_SIZE):
+                    pass
+                return
+            except OSError:
+                # Not supported (old kernel or copying between
+                # different filesystems). Start again with sendfile
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+        offset = 0
+        while True:
+            sent = os.sendfile(dst_fd, src_fd, offset, CHUNK_SIZE)
+            if sent == 0:
+                break
+            offset += sent
+
+
+def copy_file(src, dst, use_hardlinks=True):
+    """ Copies src to dst using the fastest method available:
+        hard link (same filesystem), reflink (btrfs, xfs), in kernel copy
+        (copy_file_range, sendfile) and, finally, a buffered copy """
+    if use_hardlinks:
+        try:
+            hardlink_file(src, dst)
+            return
+        except OSError:
+            pass
+
+    for copy_function in (reflink_file, kernel_copy_file):
+        try:
+            copy_function(src, dst)
+            shutil.copymode(src, dst)
+            return
+        except OSError as err:
+            logging.debug("%s can't copy %s: %s", copy_function.__name__, src, err)
+
+    shutil.copy(src, dst)
+
+
+class CopyService():
+    """ Copies downloaded packages to the xz cache dirs using a fixed
+        number of threads """
+
+    PACMAN_ISO_CACHE = "/var/cache/pacman/pkg"
+
+    MAX_THREADS = 2
+
+    def __init__(self, xz_cache_dirs, cache_indexes=None, max_threads=MAX_THREADS):
+        self.xz_cache_dirs = xz_cache_dirs
+        self.cache_indexes = cache_indexes or {}
+        self.max_threads = max_threads
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def add(self, origin, sha256=None):
+        """ Queues origin to be copied to all xz cache dirs """
+        # Avoid using the ISO itself
+        cache_dirs = [
+            xz_cache_dir for xz_cache_dir in self.xz_cache_dirs
+            if xz_cache_dir != CopyService.PACMAN_ISO_CACHE]
+        if not cache_dirs:
+            return
+        self.jobs.put((origin, sha256, cache_dirs))
+        with self.lock:
+            if len(self.threads) < self.max_threads:
+                thread = threading.Thread(target=self.worker)
+                thread.start()
+                self.threads.append(thread)
+
+    def worker(self):
+        """ Copy thread. Runs until it gets an empty job (see join) """
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    break
+                self.copy(*job)
+            finally:
+                self.jobs.task_done()
+
+    def copy(self, origin, sha256, cache_dirs):
+        """ Copies origin file to cache_dirs """
+        basename = os.path.basename(origin)
+        for xz_cache_dir in cache_dirs:
+            dst = os.path.join(xz_cache_dir, basename)
+            # Try to copy the file, do not worry if it's not possible
+            try:
+                copy_file(origin, dst)
+            except OSError:
+                continue
+            # We already know its hash, store it in the cache index
+            index = self.cache_indexes.get(xz_cache_dir)
+            if index and sha256:
+                index.add(basename, sha256)
+
+    def join(self):
+        """ Waits until all files have been copied """
+        with self.lock:
+            threads = self.threads
+            self.threads = []
+        for _thread in threads:
+            self.jobs.put(None)
+        for thread in threads:
+            thread.join()
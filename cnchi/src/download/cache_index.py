@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# cache_index.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Persistent index of the files (and their hashes) stored in a xz cache dir """
+
+import json
+import logging
+import os
+import threading
+
+try:
+    import download.download_hash as dhash
+except ModuleNotFoundError:
+    import download_hash as dhash
+
+
+class CacheIndex():
+    """ Stores the sha256 of each file of a cache directory, along with
+        its size, modification time and inode. If a file has not changed
+        since it was indexed, we do not need to hash it again.
+
+        If the cache dir has a sha256sums file (sha256sum output, as
+        offline bundles have), its hashes are trusted and added too """
+
+    INDEX_FILENAME = '.cnchi-cache-index.json'
+    SHA256SUMS_FILENAME = 'sha256sums'
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, CacheIndex.INDEX_FILENAME)
+        self.entries = {}
+        self.modified = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """ Loads index from disk (if it exists) """
+        try:
+            with open(self.index_path, 'r') as index_file:
+                self.entries = json.load(index_file)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as err:
+            logging.warning("Can't read cache index %s: %s", self.index_path, err)
+            self.entries = {}
+        self.load_sha256sums()
+
+    def load_sha256sums(self):
+        """ Adds files listed in the sha256sums file (if it exists) """
+        path = os.path.join(self.cache_dir, CacheIndex.SHA256SUMS_FILENAME)
+        try:
+            with open(path, 'r') as sums_file:
+                for line in sums_file:
+                    try:
+                        sha256, filename = line.split(maxsplit=1)
+                    except ValueError:
+                        continue
+                    # sha256sum marks binary mode with an asterisk
+                    filename = os.path.basename(filename.strip().lstrip('*'))
+                    if self.get_hash(filename) != sha256:
+                        self.add(filename, sha256)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logging.warning("Can't read %s: %s", path, err)
+
+    def save(self):
+        """ Writes index to disk (only if something has changed) """
+        with self.lock:
+            if not self.modified:
+                return
+            tmp_path = self.index_path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as index_file:
+                    json.dump(self.entries, index_file)
+                os.replace(tmp_path, self.index_path)
+                self.modified = False
+            except OSError as err:
+                # Read only cache (the ISO one, for instance)
+                logging.debug("Can't write cache index %s: %s", self.index_path, err)
+
+    @staticmethod
+    def get_file_info(path):
+        """ Returns size, mtime and inode of a file (None if it does not exist) """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def get_hash(self, filename):
+        """ Returns indexed sha256 of filename. Returns None if the
+            file is not indexed or if it has changed since then """
+        path = os.path.join(self.cache_dir, filename)
+        info = self.get_file_info(path)
+        with self.lock:
+            entry = self.entries.get(filename)
+        if info and entry and entry['info'] == info:
+            return entry['sha256']
+        return None
+
+    def add(self, filename, sha256):
+        """ Adds (or updates) a file to the index """
+        path = os.path.join(self.cache_dir, filename)
+        info = self.get_file_info(path)
+        if info is None:
+            return
+        with self.lock:
+            self.entries[filename] = {'info': info, 'sha256': sha256}
+            self.modified = True
+
+    def remove(self, filename):
+        """ Removes a file from the index """
+        with self.lock:
+            if self.entries.pop(filename, None):
+                self.modified = True
+
+    def check(self, element):
+        """ Checks that element's file is in the cache dir and that its
+            hash is right. Files are only hashed if they're not indexed """
+        filename = element['filename']
+        path = os.path.join(self.cache_dir, filename)
+
+        if not os.path.exists(path):
+            return False
+
+        sha256 = dhash.get_element_hash(element, 'sha256')
+        if not sha256:
+            # No sha256 info, we can't use the index
+            return dhash.check_hash(path, element)
+
+        file_sha256 = self.get_hash(filename)
+        if file_sha256 is None:
+            # Not indexed (or modified), hash it now
+            file_sha256 = dhash.get_file_hash(path, 'sha256')
+            self.add(filename, file_sha256)
+
+        if file_sha256 != sha256:
+            logging.warning("SHA256 hash of file %s does not match!", filename)
+            return False
+
+        logging.debug("SHA256 hash of %s is OK (cache index).", path)
+        return True
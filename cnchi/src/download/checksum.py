@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# checksum.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Computes file checksums using big buffers and several threads """
+
+import hashlib
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes read each time (a multiple of the page size)
+BUFFER_SIZE = 1024 * 1024
+
+# Files hashed at the same time. hashlib releases the GIL while hashing
+# big buffers, so threads really run in parallel
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def update_hashes(hashes, path):
+    """ Updates hash objects with a file contents (read only once) """
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as myfile:
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(myfile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        while True:
+            size = myfile.readinto(buf)
+            if not size:
+                break
+            for myhash in hashes:
+                myhash.update(view[:size])
+
+
+def update_hash(myhash, path):
+    """ Updates a hash object with a file contents """
+    update_hashes([myhash], path)
+
+
+def get_file_hashes(path, hash_types=('sha256',)):
+    """ Returns a dict with the hashes (hex) of a file, reading it only
+        once. Returns None if the file does not exist """
+    hashes = [hashlib.new(hash_type) for hash_type in hash_types]
+    try:
+        update_hashes(hashes, path)
+    except FileNotFoundError:
+        return None
+    return {myhash.name: myhash.hexdigest() for myhash in hashes}
+
+
+def get_file_hash(path, hash_type='sha256'):
+    """ Returns the hash (hex) of a file (None if it does not exist) """
+    hashes = get_file_hashes(path, (hash_type,))
+    if hashes is None:
+        return None
+    return hashes[hash_type]
+
+
+def hash_files(paths, hash_types=('sha256',), max_workers=MAX_WORKERS):
+    """ Hashes several files at the same time. Returns a dict with the
+        hashes of each path (None if the file can't be read) """
+    paths = list(paths)
+
+    def worker(path):
+        """ Hashes one file """
+        try:
+            return get_file_hashes(path, hash_types)
+        except OSError as err:
+            logging.warning("Can't hash %s: %s", path, err)
+            return None
+
+    if len(paths) < 2 or max_workers < 2:
+        return {path: worker(path) for path in paths}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(paths, executor.map(worker, paths)))
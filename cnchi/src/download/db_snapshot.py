@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# db_snapshot.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Reuses sync databases that have just been downloaded, so they do
+    not have to be downloaded again for the installed system """
+
+import logging
+import os
+import shutil
+import time
+
+try:
+    import download.cache_copy as cache_copy
+    import download.checksum as checksum
+except ModuleNotFoundError:
+    import cache_copy
+    import checksum
+
+
+class DbSnapshot():
+    """ Sync databases (path, servers, sha256) downloaded by a refresh.
+        They can be copied to another DBPath instead of refreshing it
+        while they're fresh: same mirrors, not older than TTL and not
+        modified since they were downloaded """
+
+    # Seconds a snapshot is considered fresh
+    TTL = 30 * 60
+
+    def __init__(self, entries=None):
+        # db name -> {'path', 'servers', 'sha256', 'time'}
+        self.entries = entries or {}
+
+    def to_dict(self):
+        """ Returns snapshot as a dict (to be stored in Cnchi settings) """
+        return dict(self.entries)
+
+    @staticmethod
+    def get_db_path(dbpath, db_name):
+        """ Returns the path of a sync database file """
+        return os.path.join(dbpath, 'sync', db_name + '.db')
+
+    def record(self, handle):
+        """ Stores the sync databases of an alpm handle """
+        databases = handle.get_syncdbs()
+        paths = [self.get_db_path(handle.dbpath, database.name) for database in databases]
+        hashes = checksum.hash_files(paths)
+        now = time.time()
+        self.entries = {}
+        for database, path in zip(databases, paths):
+            if hashes.get(path):
+                self.entries[database.name] = {
+                    'path': path,
+                    'servers': list(database.servers),
+                    'sha256': hashes[path]['sha256'],
+                    'time': now}
+        logging.debug("Sync databases snapshot: %s", ', '.join(self.entries))
+
+    def is_fresh(self, handle):
+        """ Checks that we have all sync databases of handle, that they
+            come from the same mirrors, and that they are still fresh """
+        now = time.time()
+        databases = handle.get_syncdbs()
+        if not databases:
+            return False
+        entries = []
+        for database in databases:
+            entry = self.entries.get(database.name)
+            if not entry:
+                logging.debug("Database %s is not in the snapshot", database.name)
+                return False
+            if entry['servers'] != list(database.servers):
+                logging.debug("Database %s mirrors have changed", database.name)
+                return False
+            if now - entry['time'] > DbSnapshot.TTL:
+                logging.debug("Database %s snapshot is too old", database.name)
+                return False
+            entries.append(entry)
+
+        hashes = checksum.hash_files([entry['path'] for entry in entries])
+        for entry in entries:
+            file_hashes = hashes.get(entry['path'])
+            if not file_hashes or file_hashes['sha256'] != entry['sha256']:
+                logging.debug("%s has changed since it was downloaded", entry['path'])
+                return False
+        return True
+
+    @staticmethod
+    def copy_file(src, dst):
+        """ Copies src to dst keeping its modification time (the mirror's
+            one), so next If-Modified-Since requests still work """
+        cache_copy.copy_file(src, dst)
+        if not os.path.samefile(src, dst):
+            # Not hard linked
+            shutil.copystat(src, dst)
+
+    def restore(self, handle):
+        """ Copies (or hard links) the snapshot databases to handle's
+            DBPath. Returns False if the snapshot can't be used """
+        if not self.is_fresh(handle):
+            return False
+
+        sync_dir = os.path.join(handle.dbpath, 'sync')
+        try:
+            os.makedirs(sync_dir, mode=0o755, exist_ok=True)
+            for database in handle.get_syncdbs():
+                src = self.entries[database.name]['path']
+                dst = self.get_db_path(handle.dbpath, database.name)
+                if os.path.abspath(src) == os.path.abspath(dst):
+                    continue
+                self.copy_file(src, dst)
+                # An old signature would not match the database
+                if os.path.exists(src + '.sig'):
+                    self.copy_file(src + '.sig', dst + '.sig')
+                elif os.path.exists(dst + '.sig'):
+                    os.remove(dst + '.sig')
+        except OSError as err:
+            logging.warning("Can't copy sync databases to %s: %s", sync_dir, err)
+            return False
+
+        logging.debug("Sync databases copied to %s (no need to download them)", sync_dir)
+        return True
+
+
+def get_snapshot(settings):
+    """ Returns the sync databases snapshot stored in Cnchi settings """
+    return DbSnapshot(settings.get('db_snapshot'))
+
+
+def save_snapshot(settings, snapshot):
+    """ Stores a sync databases snapshot in Cnchi settings """
+    settings.set('db_snapshot', snapshot.to_dict())
@@ -37,6 +37,10 @@ try:
     import pacman.pac as pac
     import download.metalink as ml
     import download.download_requests as download_requests
+    import download.download_scheduler as download_scheduler
+    import download.peer_cache as peer_cache
+    import download.mirror_history as mirror_history
+    import download.mirror_rank as mirror_rank
 except ModuleNotFoundError:
     import sys
     CNCHI_PATH = "/usr/share/cnchi"
@@ -45,6 +49,10 @@ except ModuleNotFoundError:
     import pacman.pac as pac
     import metalink as ml
     import download_requests
+    import download_scheduler
+    import peer_cache
+    import mirror_history
+    import mirror_rank
 
 from misc.events import Events
 import misc.extra as misc
@@ -86,8 +94,15 @@ class DownloadPackages():
         # List of packages' metalinks
         self.metalinks = None
 
-    def start_download(self, metalinks=None):
-        """ Begin download """
+        # Mirrors throughput measured in previous installs
+        self.mirror_history = mirror_history.get_history(self.xz_cache_dirs)
+
+        # Mirrors rank (created when needed, see get_mirror_rank)
+        self.mirror_rank = None
+
+    def start_download(self, metalinks=None, package_ready=None):
+        """ Begin download. package_ready(element) will be called each
+            time a package is ready to be installed """
         if metalinks:
             self.metalinks = metalinks
 
@@ -102,46 +117,55 @@ class DownloadPackages():
 
         proxies = self.settings.get("proxies")
 
+        # Number of packages downloaded at the same time
+        max_workers = self.settings.get('download_max_workers')
+        if not max_workers:
+            max_workers = download_requests.Download.MAX_WORKERS
+
+        # Number of simultaneous connections to the same mirror
+        max_connections = self.settings.get('download_max_connections_per_mirror')
+        if not max_connections:
+            max_connections = download_requests.Download.MAX_CONNECTIONS_PER_MIRROR
+
+        # Number of segments (mirrors) used to download big packages
+        max_segments = self.settings.get('download_max_segments')
+        if max_segments is None:
+            max_segments = download_requests.Download.MAX_SEGMENTS
+
+        # Order in which packages are downloaded
+        schedule = self.settings.get('download_schedule')
+        if not schedule:
+            schedule = download_scheduler.DownloadScheduler.LARGEST_FIRST
+
+        # LAN package caches (pacserve)
+        peers = peer_cache.get_peer_cache(self.settings)
+
         download = download_requests.Download(
             self.pacman_cache_dir,
             self.xz_cache_dirs,
             self.events.queue,
-            proxies)
-
-        if not download.start(self.metalinks):
+            proxies,
+            max_workers=max_workers,
+            max_connections_per_mirror=max_connections,
+            max_segments=max_segments,
+            schedule=schedule,
+            peers=peers)
+
+        if not download.start(self.metalinks, package_ready):
             # When we can't download (even one package), we stop right here
             txt = _("Can't download needed packages. Cnchi can't continue.")
             raise misc.InstallError(txt)
 
-    def url_sort_helper(self, url):
-        """ helper method for sorting mirror urls """
-        if not url:
-            return 9999
-        # Use the mirrorlist we created earlier to determine a url's priority
-        ranked = self.settings.get('rankmirrors_result')
-        # Use the first part of the URL to find its position in the ranked mirror list
-        partial = '/'.join(url.split('/')[:3])
-        position = [i for i, s in enumerate(ranked) if partial in s] or [9999]
-        return position[0]
-
-    def add_metalink_info(self, metalink):
-        """ Adds metalink info to metalinks list """
-        # Get metalink info
-        metalink_info = ml.get_info(metalink)
-
-        # Update downloads list with the new info from
-        # the processed metalink
-        for key in metalink_info:
-            if key not in self.metalinks:
-                self.metalinks[key] = metalink_info[key]
-                urls = metalink_info[key]['urls']
-                if self.settings:
-                    # Sort urls based on the rankmirrors mirrorlist
-                    sorted_urls = sorted(urls, key=self.url_sort_helper)
-                    self.metalinks[key]['urls'] = sorted_urls
-                else:
-                    # When testing, settings is not available
-                    self.metalinks[key]['urls'] = urls
+    def get_mirror_rank(self):
+        """ Creates the mirrors rank map from the rankmirrors mirrorlist """
+        self.mirror_rank = mirror_rank.get_mirror_rank(self.settings, self.mirror_history)
+        return self.mirror_rank
+
+    def add_plan(self, plan):
+        """ Adds download plan entries to metalinks list """
+        for entry in plan:
+            if entry.identity not in self.metalinks:
+                self.metalinks[entry.identity] = entry
 
     @misc.raise_privileges
     def create_metalinks_list(self):
@@ -150,8 +174,6 @@ class DownloadPackages():
         self.events.add('percent', 0)
         self.events.add(
             'info', _('Creating the list of packages to download...'))
-        processed_packages = 0
-        total_packages = len(self.package_names)
 
         self.metalinks = {}
 
@@ -169,23 +191,25 @@ class DownloadPackages():
             logging.error(message)
             return False
 
+        def progress(done, total):
+            """ Show progress to the user """
+            self.events.add('percent', round(done / total, 2))
+
         try:
-            for package_name in self.package_names:
-                metalink = ml.create(pacman, package_name,
-                                     self.pacman_conf_file)
-                if metalink is None:
-                    txt = "Error creating metalink for package %s. Installation will stop"
-                    logging.error(txt, package_name)
-                    txt = _("Error creating metalink for package {}. "
-                            "Installation will stop").format(package_name)
-                    raise misc.InstallError(txt)
-
-                self.add_metalink_info(metalink)
-
-                # Show progress to the user
-                processed_packages += 1
-                percent = round(float(processed_packages / total_packages), 2)
-                self.events.add('percent', percent)
+            # Resolve all packages (and their dependencies) at once
+            # Urls are sorted based on the rankmirrors mirrorlist
+            plan = ml.create_plan(
+                pacman, self.package_names, self.pacman_conf_file, progress,
+                self.get_mirror_rank())
+            if plan is None:
+                txt = "Error creating the list of packages to download. Installation will stop"
+                logging.error(txt)
+                txt = _("Error creating the list of packages to download. "
+                        "Installation will stop")
+                raise misc.InstallError(txt)
+
+            self.add_plan(plan)
+            self.events.add('percent', 1)
 
             pacman.release()
             del pacman
@@ -31,7 +31,11 @@
 
 import hashlib
 import logging
-import os
+
+try:
+    import download.checksum as checksum
+except ModuleNotFoundError:
+    import checksum
 
 def check_hash(path, element, queue_event=None):
     """ Checks file hash (sha256 or md5) """
@@ -71,22 +75,35 @@ def check_hash(path, element, queue_event=None):
         queue_event('cache_pkgs_md5_check_failed', identity)
     return True
 
-def get_file_hash(path, hash_type):
-    """ Gets md5 or sha256 hash from a file """
-
-    if not os.path.exists(path):
-        return None
-
-    if hash_type == 'md5':
-        myhash = hashlib.md5()
-    else:
-        myhash = hashlib.sha256()
+def new_hash(element):
+    """ Returns an empty hash object (sha256 or md5) to check element's
+        file while it is being downloaded (None if there is no hash info) """
+    for hash_type in ('sha256', 'md5'):
+        if get_element_hash(element, hash_type):
+            return hashlib.new(hash_type)
+    return None
+
+def check_hash_object(myhash, element):
+    """ Checks a hash object (see new_hash) already updated with
+        all file contents against element's hash info """
+    filename = element['filename']
+    hash_type = myhash.name
+    if myhash.hexdigest() != get_element_hash(element, hash_type):
+        logging.warning(
+            "%s hash of file %s does not match!", hash_type.upper(), filename)
+        return False
+    logging.debug("%s hash of %s is OK.", hash_type.upper(), filename)
+    return True
 
-    with open(path, 'rb') as myfile:
-        for line in myfile:
-            myhash.update(line)
+def update_hash_from_file(myhash, path):
+    """ Updates a hash object with a file contents """
+    checksum.update_hash(myhash, path)
 
-    return myhash.hexdigest()
+def get_file_hash(path, hash_type):
+    """ Gets md5 or sha256 hash from a file """
+    if hash_type != 'md5':
+        hash_type = 'sha256'
+    return checksum.get_file_hash(path, hash_type)
 
 def get_element_hash(element, hash_type):
     """ Get hash from one metalink element """
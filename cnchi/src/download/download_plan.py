@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# download_plan.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" In memory list of packages to download (built directly from alpm
+    packages, without creating and parsing metalink xml documents) """
+
+# Maximum number of urls stored for each package
+MAX_URLS = 15
+
+
+class PlanEntry():
+    """ One package to download. It can be used as the dicts returned by
+        metalink.get_info (entry['filename'], entry.get('size'), ...) """
+
+    __slots__ = (
+        'identity', 'filename', 'version', 'size', 'description',
+        'repo', 'hash', 'urls', 'sig_urls')
+
+    def __init__(self, identity, filename, version='', size=0, description='',
+                 repo=None, hashes=None, urls=None, sig_urls=None):
+        self.identity = identity
+        self.filename = filename
+        self.version = version
+        self.size = size
+        self.description = description
+        self.repo = repo
+        self.hash = hashes or {}
+        self.urls = urls or []
+        self.sig_urls = sig_urls or []
+
+    @classmethod
+    def from_pkg(cls, pkg, urls, sigs=False):
+        """ Creates an entry from an alpm package and its urls """
+        urls = list(urls)[:MAX_URLS]
+        hashes = {}
+        if pkg.sha256sum:
+            hashes['sha256'] = pkg.sha256sum
+        if pkg.md5sum:
+            hashes['md5'] = pkg.md5sum
+        if sigs:
+            sig_urls = [url + '.sig' for url in urls]
+        else:
+            sig_urls = []
+        return cls(
+            pkg.name, pkg.filename, version=pkg.version, size=pkg.size,
+            description=pkg.desc, repo=pkg.db.name, hashes=hashes,
+            urls=urls, sig_urls=sig_urls)
+
+    def __repr__(self):
+        return 'PlanEntry({0}, {1})'.format(self.identity, self.filename)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in PlanEntry.__slots__
+
+    def get(self, key, default=None):
+        """ Returns key's value (default if it does not exist) """
+        return getattr(self, key, default)
+
+    def copy(self):
+        """ Returns a (shallow) copy of this entry """
+        return PlanEntry(
+            self.identity, self.filename, self.version, self.size,
+            self.description, self.repo, dict(self.hash), list(self.urls),
+            list(self.sig_urls))
+
+
+class DownloadPlan():
+    """ Ordered set of packages to download (identity -> PlanEntry) """
+
+    __slots__ = ('entries',)
+
+    def __init__(self, entries=None):
+        self.entries = {}
+        for entry in entries or []:
+            self.add(entry)
+
+    @classmethod
+    def from_download_queue(cls, download_queue):
+        """ Creates a plan from a metalink.DownloadQueue """
+        return cls(
+            PlanEntry.from_pkg(pkg, urls, sigs)
+            for pkg, urls, sigs in download_queue.sync_pkgs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __contains__(self, identity):
+        return identity in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def add(self, entry):
+        """ Adds an entry (a package already in the plan is not replaced) """
+        if entry.identity not in self.entries:
+            self.entries[entry.identity] = entry
+
+    def update(self, other):
+        """ Adds all entries of another plan """
+        for entry in other:
+            self.add(entry)
+
+    def to_dict(self):
+        """ Returns plan as a dict (identity -> PlanEntry) """
+        return dict(self.entries)
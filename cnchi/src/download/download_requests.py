@@ -31,7 +31,6 @@
 
 import os
 import logging
-import shutil
 import time
 import socket
 import io
@@ -43,8 +42,24 @@ from misc.events import Events
 
 try:
     import download.download_hash as dhash
+    import download.download_session as download_session
+    import download.mirror_health as mirror_health
+    import download.cache_index as cache_index
+    import download.cache_copy as cache_copy
+    import download.download_stats as download_stats
+    import download.download_scheduler as download_scheduler
+    import download.peer_cache as peer_cache
+    import download.mirror_history as mirror_history
 except ModuleNotFoundError:
     import download_hash as dhash
+    import download_session
+    import mirror_health
+    import cache_index
+    import cache_copy
+    import download_stats
+    import download_scheduler
+    import peer_cache
+    import mirror_history
 
 # When testing, no _() is available
 try:
@@ -53,45 +68,49 @@ except NameError as err:
     def _(message):
         return message
 
-class CopyToCache(threading.Thread):
-    ''' Class thread to copy a xz file to the user's
-        provided cache directory '''
+class Download():
+    """ Class to download packages using requests
+        This class tries to previously download all necessary packages for
+        Antergos installation using requests """
 
-    PACMAN_ISO_CACHE = "/var/cache/pacman/pkg"
+    # Default number of packages that will be downloaded at the same time
+    MAX_WORKERS = 4
 
-    def __init__(self, origin, xz_cache_dirs):
-        threading.Thread.__init__(self)
-        self.origin = origin
-        self.xz_cache_dirs = xz_cache_dirs
+    # Default number of simultaneous connections to the same mirror
+    MAX_CONNECTIONS_PER_MIRROR = 2
 
-    def run(self):
-        basename = os.path.basename(self.origin)
-        for xz_cache_dir in self.xz_cache_dirs:
-            # Avoid using the ISO itself
-            if xz_cache_dir != CopyToCache.PACMAN_ISO_CACHE:
-                dst = os.path.join(xz_cache_dir, basename)
-                # Try to copy the file, do not worry if it's not possible
-                try:
-                    shutil.copy(self.origin, dst)
-                except (FileNotFoundError, FileExistsError, OSError):
-                    pass
+    # Packages bigger than this (in bytes) are downloaded in segments
+    SEGMENTED_MIN_SIZE = 32 * 1024 * 1024
 
+    # Default number of segments (and mirrors) used to download a big package
+    MAX_SEGMENTS = 4
 
-class Download():
-    """ Class to download packages using requests
-        This class tries to previously download all necessary packages for
-        Antergos installation using requests """
+    # Suffix of files being downloaded
+    PART_SUFFIX = '.part'
+
+    # Suffix of files being downloaded in segments
+    SEGMENTS_SUFFIX = '.segments'
 
-    def __init__(self, pacman_cache_dir, xz_cache_dirs, callback_queue, proxies=None):
+    def __init__(self, pacman_cache_dir, xz_cache_dirs, callback_queue, proxies=None,
+                 max_workers=MAX_WORKERS,
+                 max_connections_per_mirror=MAX_CONNECTIONS_PER_MIRROR,
+                 max_segments=MAX_SEGMENTS,
+                 schedule=download_scheduler.DownloadScheduler.LARGEST_FIRST,
+                 peers=None):
         """ Initialize Download class. Gets default configuration """
         self.pacman_cache_dir = pacman_cache_dir
         self.xz_cache_dirs = xz_cache_dirs
         self.proxies = proxies
 
-        self.events = Events(callback_queue)
+        # Workers send lots of progress events, coalesce them
+        self.events = Events(callback_queue, coalesce=True)
+
+        # Shared pool of keep-alive http sessions (one for each mirror)
+        self.sessions = download_session.get_pool()
 
         if self.proxies:
             logging.debug("Will use these proxy settings: %s", self.proxies)
+            self.sessions.set_proxies(self.proxies)
 
         # Check that pacman cache directory exists
         os.makedirs(self.pacman_cache_dir, mode=0o755, exist_ok=True)
@@ -99,106 +118,296 @@ class Download():
         # Stores last issued event (to prevent repeating events)
         self.last_event = {}
 
-        self.copy_to_cache_threads = []
-
-
-    def start(self, downloads):
-        """ Downloads using requests """
-        downloaded = 0
-        total_downloads = len(downloads)
+        # Index of known files (and their hashes) of each cache dir
+        self.cache_indexes = {}
+        for xz_cache_dir in self.xz_cache_dirs:
+            self.cache_indexes[xz_cache_dir] = cache_index.CacheIndex(xz_cache_dir)
+
+        # LAN package caches, asked before using the mirrors
+        self.peers = peers or peer_cache.PeerCache()
+
+        # Copies downloaded packages to the xz cache dirs
+        self.copy_service = cache_copy.CopyService(
+            self.xz_cache_dirs, self.cache_indexes)
+
+        self.max_workers = max(1, max_workers or 1)
+        self.max_connections_per_mirror = max(1, max_connections_per_mirror or 1)
+        self.max_segments = max_segments or 1
+
+        # Policy that decides in which order packages are downloaded
+        self.schedule = schedule
+
+        # One semaphore for each mirror host (limits connections per mirror)
+        self.mirror_slots = {}
+        self.mirror_slots_lock = threading.Lock()
+
+        # Shared download counters (protected by self.lock)
+        self.lock = threading.Lock()
+        self.downloaded = 0
+        self.total_downloads = 0
+        self.transferred = 0
+        self.start_time = 0
+        # When the overall download speed was last shown
+        self.last_emit = 0
+
+        # Set when a package can't be downloaded from any mirror
+        self.abort = threading.Event()
+
+        # First unexpected exception raised by a worker (re-raised by start)
+        self.error = None
+
+        # Called when a package is ready in pacman's cache
+        self.package_ready = None
+
+        # Mirrors health (shared by all downloads)
+        self.mirror_health = mirror_health.MirrorHealth()
+
+        # Download metrics (written to a json report when finished)
+        self.stats = download_stats.DownloadStats()
+        self.stats.options = {
+            'max_workers': self.max_workers,
+            'max_connections_per_mirror': self.max_connections_per_mirror,
+            'max_segments': self.max_segments,
+            'schedule': self.schedule,
+            'peers': list(self.peers.servers)}
+
+    @property
+    def concurrent(self):
+        """ True if more than one package is downloaded at the same time """
+        return self.max_workers > 1
+
+    def get_mirror_slot(self, url):
+        """ Returns the semaphore that limits connections to url's mirror """
+        host = download_session.get_host(url)
+        with self.mirror_slots_lock:
+            if host not in self.mirror_slots:
+                self.mirror_slots[host] = threading.BoundedSemaphore(
+                    self.max_connections_per_mirror)
+            return self.mirror_slots[host]
+
+    def start(self, downloads, package_ready=None):
+        """ Downloads using requests. If given, package_ready(element) is
+            called (from a worker thread) as soon as each package is
+            available in pacman's cache """
+        self.package_ready = package_ready
+        self.downloaded = 0
+        self.total_downloads = len(downloads)
+        self.transferred = 0
+        self.start_time = time.perf_counter()
+        self.last_emit = 0
+        self.abort.clear()
+        self.stats.start()
+        self.error = None
 
         self.events.add('downloads_progress_bar', 'show')
         self.events.add('downloads_percent', '0')
 
-        self.copy_to_cache_threads = []
-
         logging.debug(
-            "Downloading packages to pacman cache dir '%s'",
-            self.pacman_cache_dir)
+            "Downloading packages to pacman cache dir '%s' (%d at a time)",
+            self.pacman_cache_dir,
+            self.max_workers)
 
+        pending = []
         while downloads:
-            needs_to_download = True
-
             # Get package to download from downloads list
             _identity, element = downloads.popitem()
+            pending.append(element)
 
-            self.events.add('percent', 0)
+        num_workers = min(self.max_workers, len(pending))
+        elements = download_scheduler.DownloadScheduler(
+            pending, self.schedule, num_workers)
 
-            txt = _("Fetching {0} {1} ({2}/{3})...").format(
-                element['identity'],
-                element['version'],
-                downloaded + 1,
-                total_downloads)
-            self.events.add('info', txt)
-
-            dst_path = os.path.join(self.pacman_cache_dir, element['filename'])
-
-            if os.path.exists(dst_path):
-                # File already exists in destination pacman's cache
-                # (previous install?). We check the file hash.
-                if not dhash.check_hash(dst_path, element):
-                    # We're sure it's a wrong hash. Force to download it
-                    needs_to_download = True
-                else:
-                    needs_to_download = False
-                    logging.debug(
-                        "File %s found in %s cache, there is no need to download it",
-                        element['filename'],
-                        self.pacman_cache_dir)
-            else:
-                needs_to_download = True
-                # Check all cache directories
-                for xz_cache_dir in self.xz_cache_dirs:
-                    dst_xz_cache_path = os.path.join(
-                        xz_cache_dir,
-                        element['filename'])
-
-                    if (os.path.exists(dst_xz_cache_path) and
-                            dhash.check_hash(dst_xz_cache_path, element)):
-                        # We're lucky, the package is already downloaded
-                        # in the cache the user has given us
-                        # and its hash checks out
-                        try:
-                            shutil.copy(dst_xz_cache_path, dst_path)
-                            needs_to_download = False
-                            logging.debug(
-                                "%s found in %s cache, there is no need to download it",
-                                element['filename'],
-                                xz_cache_dir)
-                            # Get out of the cache for loop, as we managed
-                            # to find the package in this cache directory
-                            break
-                        except OSError as os_error:
-                            needs_to_download = True
-                            logging.debug(
-                                "Error copying %s to %s : %s",
-                                dst_xz_cache_path,
-                                dst_path,
-                                os_error)
-
-            if needs_to_download and not self.download_package(element, dst_path):
-                # None of the mirror urls works.
-                # Stop right here, so the user does not have to wait
-                # to download the other packages.
-                logging.error(
-                    "Can't download %s, even after trying all available mirrors",
-                    element['filename'])
-                return False
-
-            downloaded += 1
+        workers = []
+        for index in range(num_workers):
+            worker = threading.Thread(target=self.worker, args=(elements, index))
+            worker.start()
+            workers.append(worker)
 
-            self.events.add('progress_bar_show_text', '')
+        for worker in workers:
+            worker.join()
 
-            downloads_percent = round(float(downloaded / total_downloads), 2)
-            self.events.add('downloads_percent', str(downloads_percent))
+        # Send last progress info
+        self.events.flush()
 
         # Wait until all xz packages are also copied to provided cache (if any)
-        for copy_to_cache_thread in self.copy_to_cache_threads:
-            copy_to_cache_thread.join()
+        self.copy_service.join()
+
+        # Store cache indexes, so next time we do not need to hash
+        # the same files again
+        for index in self.cache_indexes.values():
+            index.save()
+
+        self.stats.finish()
+        self.stats.write_report()
+
+        # Remember how mirrors worked, so next installs use the best ones first
+        history = mirror_history.get_history(self.xz_cache_dirs)
+        history.update(self.stats)
+        history.save()
+
+        if self.error is not None:
+            raise self.error
+
+        if self.abort.is_set():
+            return False
 
         self.events.add('downloads_progress_bar', 'hide')
         return True
 
+    def worker(self, elements, index):
+        """ Worker thread. Gets packages from the elements scheduler until
+            it's empty (or until a package can't be downloaded) """
+        while not self.abort.is_set():
+            element = elements.get(index)
+            if element is None:
+                break
+
+            try:
+                self.process_element(element)
+            except Exception as err:
+                # Do not let the thread die silently (no space left,
+                # unexpected requests error...). start() will raise it
+                logging.error("Error getting %s: %s", element['filename'], err)
+                self.stats.add_failed_package(element['filename'])
+                with self.lock:
+                    if self.error is None:
+                        self.error = err
+                self.abort.set()
+                break
+
+    def process_element(self, element):
+        """ Gets a package and updates the download progress """
+        if not self.get_package(element):
+            # None of the mirror urls works.
+            # Stop right here, so the user does not have to wait
+            # to download the other packages.
+            logging.error(
+                "Can't download %s, even after trying all available mirrors",
+                element['filename'])
+            self.stats.add_failed_package(element['filename'])
+            self.abort.set()
+            return
+
+        if self.package_ready:
+            self.package_ready(element)
+
+        if not self.concurrent:
+            self.add_progress('')
+
+        # Send the percent while holding the lock, so a slower worker
+        # can't overwrite it with an older (lower) value
+        with self.lock:
+            self.downloaded += 1
+            downloads_percent = round(
+                float(self.downloaded / self.total_downloads), 2)
+            self.events.add('downloads_percent', str(downloads_percent))
+
+    def get_package(self, element):
+        """ Gets a package from pacman's cache, from the xz cache dirs
+            or downloading it. Returns False if the package can't be
+            retrieved """
+        needs_to_download = True
+
+        if not self.concurrent:
+            self.add_progress('', 0)
+
+        with self.lock:
+            txt = _("Fetching {0} {1} ({2}/{3})...").format(
+                element['identity'],
+                element['version'],
+                self.downloaded + 1,
+                self.total_downloads)
+        self.events.add('info', txt)
+
+        dst_path = os.path.join(self.pacman_cache_dir, element['filename'])
+
+        if os.path.exists(dst_path):
+            # File already exists in destination pacman's cache
+            # (previous install?). We check the file hash.
+            if not dhash.check_hash(dst_path, element):
+                # We're sure it's a wrong hash. Force to download it
+                needs_to_download = True
+            else:
+                needs_to_download = False
+                self.stats.add_cache_hit('pacman')
+                logging.debug(
+                    "File %s found in %s cache, there is no need to download it",
+                    element['filename'],
+                    self.pacman_cache_dir)
+        else:
+            needs_to_download = True
+            # Check all cache directories
+            for xz_cache_dir in self.xz_cache_dirs:
+                dst_xz_cache_path = os.path.join(
+                    xz_cache_dir,
+                    element['filename'])
+
+                if self.cache_indexes[xz_cache_dir].check(element):
+                    # We're lucky, the package is already downloaded
+                    # in the cache the user has given us
+                    # and its hash checks out
+                    try:
+                        cache_copy.copy_file(dst_xz_cache_path, dst_path)
+                        needs_to_download = False
+                        self.stats.add_cache_hit('xz')
+                        logging.debug(
+                            "%s found in %s cache, there is no need to download it",
+                            element['filename'],
+                            xz_cache_dir)
+                        # Get out of the cache for loop, as we managed
+                        # to find the package in this cache directory
+                        break
+                    except OSError as os_error:
+                        needs_to_download = True
+                        logging.debug(
+                            "Error copying %s to %s : %s",
+                            dst_xz_cache_path,
+                            dst_path,
+                            os_error)
+
+        if needs_to_download:
+            if self.download_from_peers(element, dst_path):
+                self.stats.add_cache_hit('peer')
+                return True
+            self.stats.add_cache_miss()
+            return self.download_package(element, dst_path)
+        return True
+
+    def download_from_peers(self, element, dst_path):
+        """ Tries to get the package from the LAN package caches """
+        for url in self.peers.get_urls(element):
+            # Keep peers out of the mirror history
+            self.stats.add_peer(url)
+            if not self.mirror_health.allow_request(url):
+                continue
+            if not self.peer_has_package(url):
+                continue
+            if self.download_url(url, dst_path, element):
+                logging.debug("%s downloaded from LAN cache %s", element['filename'], url)
+                # Copy downloaded xz file to the cache the user has provided, too.
+                self.copy_service.add(
+                    dst_path, dhash.get_element_hash(element, 'sha256'))
+                return True
+        return False
+
+    def peer_has_package(self, url):
+        """ Asks a LAN package cache if it has a package. A missing
+            package is not an error, only peers that do not answer are
+            marked as failing """
+        try:
+            with self.sessions.head(
+                url, allow_redirects=True,
+                timeout=peer_cache.PeerCache.TIMEOUT) as req:
+                # The peer works (even if it does not have this package).
+                # This also ends a half-open probe, or the peer would not
+                # be asked again
+                self.mirror_health.record_success(url, 0, 0)
+                return req.status_code == requests.codes.ok
+        except requests.exceptions.RequestException as err:
+            logging.debug("LAN package cache %s is not available: %s", url, err)
+            self.mirror_health.record_failure(url)
+            return False
+
     def download_package(self, element, dst_path):
         """ Package wasn't previously downloaded or its md5 was wrong
             We'll have to download it
@@ -211,96 +420,377 @@ class Download():
             element['version'],
             len(element['urls']))
 
-        for url in element['urls']:
+        download_ok = False
+
+        # Try healthy mirrors first
+        urls = self.mirror_health.sort_urls(element['urls'])
+
+        if self.use_segments(element):
+            # Big package, download it in pieces from several mirrors
+            download_ok = self.download_segmented(element, dst_path, urls)
+
+        # Mirrors we have stopped using for a while. We'll only
+        # try them if all the others fail
+        skipped_urls = []
+
+        attempt = 0
+        for url in urls:
+            if download_ok:
+                break
+
             # Let's catch empty values as well as None just to be safe
             if not url:
                 # Something bad has happened, let's try another mirror
-                download_ok = False
                 logging.debug(
                     "Package %s-%s has an empty url for this mirror",
                     element['identity'],
                     element['version'])
-            else:
-                download_ok = self.download_url(url, dst_path, element)
+                continue
 
-            if download_ok:
-                # Copy downloaded xz file to the cache the user has provided, too.
-                copy_to_cache_thread = CopyToCache(dst_path, self.xz_cache_dirs)
-                copy_to_cache_thread.start()
-                self.copy_to_cache_threads.append(copy_to_cache_thread)
+            if not self.mirror_health.allow_request(url):
+                skipped_urls.append(url)
+                continue
+
+            download_ok = self.try_url(url, dst_path, element, attempt)
+            attempt += 1
 
-                # Get out of the for loop, as we managed
-                # to download the package
+        for url in skipped_urls:
+            if download_ok:
                 break
-            else:
-                # requests failed to obtain the file. Wrong url?
-                msg = "Can't download %s, Cnchi will try another mirror."
-                logging.debug(msg, url)
-                # delays for 20 seconds
-                time.sleep(20)
+            download_ok = self.try_url(url, dst_path, element, attempt)
+            attempt += 1
+
+        if download_ok:
+            # Copy downloaded xz file to the cache the user has provided, too.
+            self.copy_service.add(
+                dst_path, dhash.get_element_hash(element, 'sha256'))
 
         return download_ok
 
+    def try_url(self, url, dst_path, element, attempt):
+        """ Downloads element from url. Waits a bit if it fails """
+        if attempt > 0:
+            self.stats.add_retry()
+        if self.download_url(url, dst_path, element):
+            return True
+        # requests failed to obtain the file. Wrong url?
+        msg = "Can't download %s, Cnchi will try another mirror."
+        logging.debug(msg, url)
+        self.mirror_health.backoff(attempt)
+        return False
+
+    @staticmethod
+    def get_element_size(element):
+        """ Returns package size stored in its metalink info (0 if unknown) """
+        try:
+            return int(element.get('size', 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def use_segments(self, element):
+        """ Checks if a package is big enough to be downloaded in segments """
+        if self.max_segments < 2:
+            return False
+        urls = [url for url in element['urls'] if url]
+        size = self.get_element_size(element)
+        return len(urls) > 1 and size >= Download.SEGMENTED_MIN_SIZE
+
+    def download_segmented(self, element, dst_path, urls):
+        """ Downloads a file splitting it in several HTTP Range segments.
+            Each segment is downloaded from a different mirror (the best
+            ranked ones) at the same time and written in place """
+        urls = [url for url in urls if url]
+        total_length = self.get_element_size(element)
+        num_segments = min(self.max_segments, len(urls))
+        segment_length = total_length // num_segments
+
+        logging.debug(
+            "Downloading %s in %d segments from %d mirrors",
+            element['filename'], num_segments, num_segments)
+
+        # Segments are written in a temporary file, so a failed
+        # download never leaves a wrong file (nor a wrong .part file)
+        seg_path = dst_path + Download.SEGMENTS_SUFFIX
+
+        # Preallocate file so each segment can be written in its place
+        try:
+            with open(seg_path, 'wb') as xz_file:
+                xz_file.truncate(total_length)
+        except OSError as os_error:
+            logging.debug(os_error)
+            return False
+
+        segments = []
+        for index in range(num_segments):
+            first_byte = index * segment_length
+            if index == num_segments - 1:
+                last_byte = total_length - 1
+            else:
+                last_byte = first_byte + segment_length - 1
+            # Start each segment in a different mirror, and use the
+            # others (in rank order) as fallback
+            segment_urls = urls[index:] + urls[:index]
+            segments.append((first_byte, last_byte, segment_urls))
+
+        results = [False] * num_segments
+        threads = []
+        for index, segment in enumerate(segments):
+            thread = threading.Thread(
+                target=self.segment_worker,
+                args=(seg_path, segment, results, index))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        # Check hash of the reassembled package
+        if not all(results) or not dhash.check_hash(seg_path, element):
+            logging.debug(
+                "Segmented download of %s failed", element['filename'])
+            self.remove_file(seg_path)
+            return False
+
+        os.replace(seg_path, dst_path)
+        return True
+
+    def segment_worker(self, dst_path, segment, results, index):
+        """ Thread that downloads one segment, trying all its urls """
+        first_byte, last_byte, urls = segment
+        for url in urls:
+            if self.abort.is_set():
+                return
+            if self.download_range(url, dst_path, first_byte, last_byte):
+                results[index] = True
+                return
+
+    def download_range(self, url, dst_path, first_byte, last_byte):
+        """ Downloads bytes first_byte to last_byte (both included) from url,
+            writing them in the same position of dst_path """
+        expected_length = last_byte - first_byte + 1
+        headers = {'Range': 'bytes={0}-{1}'.format(first_byte, last_byte)}
+        completed_length = 0
+        start = time.perf_counter()
+        with self.get_mirror_slot(url):
+            try:
+                with self.sessions.get(url, stream=True, timeout=30, headers=headers) as req:
+                    self.stats.add_request(url, time.perf_counter() - start)
+                    if req.status_code != requests.codes.partial_content:
+                        # Mirror does not support Range requests (or it
+                        # does not have the file)
+                        logging.debug(
+                            "Mirror does not support range requests for %s", url)
+                        if req.status_code >= 400:
+                            self.mirror_health.record_failure(url)
+                            self.stats.add_failure(url)
+                        return False
+
+                    with open(dst_path, 'r+b') as xz_file:
+                        xz_file.seek(first_byte)
+                        for data in req.iter_content(io.DEFAULT_BUFFER_SIZE):
+                            if not data:
+                                break
+                            if completed_length + len(data) > expected_length:
+                                # Server sent more than we asked for
+                                self.mirror_health.record_failure(url)
+                                self.stats.add_failure(url)
+                                return False
+                            xz_file.write(data)
+                            completed_length += len(data)
+                            if self.concurrent:
+                                self.update_transferred(len(data))
+            except (socket.timeout,
+                    OSError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as connection_error:
+                logging.debug(connection_error)
+                self.mirror_health.record_failure(url)
+                self.stats.add_failure(url)
+                return False
+            finally:
+                self.stats.add_transfer(
+                    url, completed_length, time.perf_counter() - start)
+
+        if completed_length != expected_length:
+            self.mirror_health.record_failure(url)
+            self.stats.add_failure(url)
+            return False
+
+        self.mirror_health.record_success(
+            url, completed_length, time.perf_counter() - start)
+        return True
+
     def download_url(self, url, dst_path, element=None):
         """ Downloads file from url to dst_path and checks its md5 hash """
+        with self.get_mirror_slot(url):
+            download_ok = self.download_url_from_mirror(url, dst_path, element)
+        if not download_ok:
+            self.mirror_health.record_failure(url)
+            self.stats.add_failure(url)
+        return download_ok
+
+    def download_url_from_mirror(self, url, dst_path, element=None):
+        """ Downloads file from url to dst_path and checks its md5 hash
+            (the caller must hold the mirror slot).
+            Data is written to a .part file first. If a previous .part
+            file exists, the download continues where it was left
+            (using an HTTP Range request) """
         percent = 0
         completed_length = 0
         start = time.perf_counter()
+
+        part_path = dst_path + Download.PART_SUFFIX
+        resume_length = self.get_resume_length(part_path, element)
+
+        headers = {}
+        if resume_length:
+            headers['Range'] = 'bytes={0}-'.format(resume_length)
+
         try:
             # By default, get waits five minutes before
             # issuing a timeout, which is too much.
-            if self.proxies:
-                req = requests.get(
-                    url,
-                    stream=True,
-                    timeout=30,
-                    proxies=self.proxies)
-            else:
-                req = requests.get(
-                    url,
-                    stream=True,
-                    timeout=30)
+            # Closing the response gives the connection back to the pool
+            with self.sessions.get(url, stream=True, timeout=30, headers=headers) as req:
+                self.stats.add_request(url, time.perf_counter() - start)
+                if req.status_code == requests.codes.requested_range_not_satisfiable:
+                    # Our .part file is no good, start again
+                    self.remove_file(part_path)
+                    return False
+
+                if resume_length and req.status_code == requests.codes.partial_content:
+                    logging.debug(
+                        "Resuming download of %s from byte %d", url, resume_length)
+                    mode = 'ab'
+                elif req.status_code == requests.codes.ok:
+                    # Mirror does not support ranges (or there was
+                    # nothing to resume), download the whole file
+                    resume_length = 0
+                    mode = 'wb'
+                else:
+                    return False
 
-            if req.status_code == requests.codes.ok:
                 # Get total file length
                 try:
                     total_length = int(req.headers.get('content-length'))
+                    total_length += resume_length
                 except TypeError:
                     total_length = 0
                     logging.debug(
                         "Metalink for package %s has no size info", url)
 
-                with open(dst_path, 'wb') as xz_file:
+                # Compute file hash while it's being downloaded, so
+                # we do not have to read it again from disk
+                myhash = dhash.new_hash(element) if element else None
+                if myhash and resume_length:
+                    # Only the part we already have is read from disk
+                    dhash.update_hash_from_file(myhash, part_path)
+
+                completed_length = resume_length
+
+                with open(part_path, mode) as xz_file:
                     for data in req.iter_content(io.DEFAULT_BUFFER_SIZE):
                         if not data:
                             break
                         xz_file.write(data)
+                        if myhash:
+                            myhash.update(data)
                         completed_length += len(data)
-                        old_percent = percent
+                        if self.concurrent:
+                            # Several files are being downloaded, show
+                            # the overall download speed instead
+                            self.update_transferred(len(data))
+                            continue
                         if total_length > 0:
                             percent = float(completed_length / total_length)
                             percent = round(percent, 2)
                         else:
                             percent += 0.1
-                        if old_percent != percent:
-                            self.events.add('percent', percent)
                         bps = completed_length // (time.perf_counter() - start)
                         msg = self.format_progress_message(percent, bps)
-                        self.events.add('progress_bar_show_text', msg)
-
-                # Check hash of downloaded package
-                if element and not dhash.check_hash(dst_path, element):
-                    # Wrong hash! Force to download the file again
-                    return False
+                        self.add_progress(msg, percent)
+
+            # Check hash of downloaded package
+            if myhash and not dhash.check_hash_object(myhash, element):
+                # Wrong hash! Force to download the file again
+                # (from the beginning)
+                self.stats.add_hash_failure(url)
+                self.remove_file(part_path)
+                return False
+            elif element and not myhash:
+                # No hash info, let check_hash log (and report) it
+                dhash.check_hash(part_path, element)
         except (socket.timeout,
                 requests.exceptions.Timeout,
                 requests.exceptions.ConnectionError,
                 requests.exceptions.ChunkedEncodingError) as connection_error:
+            # Keep the .part file, next try will resume it
             logging.debug(connection_error)
             return False
+        finally:
+            received = max(0, completed_length - resume_length)
+            self.stats.add_transfer(url, received, time.perf_counter() - start)
+
+        os.replace(part_path, dst_path)
 
+        # Only count the bytes of this request (not the resumed ones),
+        # or resumed downloads would make the mirror look faster
+        self.mirror_health.record_success(
+            url, completed_length - resume_length, time.perf_counter() - start)
         return True
 
+    def get_resume_length(self, part_path, element):
+        """ Returns how many bytes of a previous download can be reused """
+        try:
+            resume_length = os.path.getsize(part_path)
+        except OSError:
+            return 0
+        size = self.get_element_size(element) if element else 0
+        if size and resume_length >= size:
+            # Can't be right, start again
+            self.remove_file(part_path)
+            return 0
+        return resume_length
+
+    @staticmethod
+    def remove_file(path):
+        """ Removes a file (do not complain if it does not exist) """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def update_transferred(self, length):
+        """ Adds length bytes to the overall transferred bytes. The overall
+            download speed is shown at most once per flush interval (this
+            is called for every chunk of data, from all workers) """
+        now = time.perf_counter()
+        with self.lock:
+            self.transferred += length
+            if now - self.last_emit < self.events.flush_interval:
+                return
+            self.last_emit = now
+            elapsed = now - self.start_time
+            transferred = self.transferred
+            percent = self.downloaded / self.total_downloads
+        if elapsed > 0:
+            bps = transferred // elapsed
+            msg = self.format_progress_message(percent, bps)
+            # Several files are being downloaded, show the overall fraction
+            self.add_progress(msg, round(percent, 2))
+
+    def add_progress(self, msg, percent=None):
+        """ Shows download progress in the main progress bar. If packages
+            are being installed while they are downloaded, that bar shows
+            pacman's progress, so only the downloads bar text is used
+            (the downloads bar fraction already shows the overall progress) """
+        if self.package_ready:
+            self.events.add('downloads_progress_bar_show_text', msg)
+            return
+        if percent is not None:
+            self.events.add('percent', percent)
+        self.events.add('progress_bar_show_text', msg)
+
     @staticmethod
     def format_progress_message(percent, bps):
         """ Formats speed message information """
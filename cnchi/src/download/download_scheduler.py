@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# download_scheduler.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Decides in which order packages are downloaded """
+
+import logging
+import threading
+
+from collections import deque
+
+
+class DownloadScheduler():
+    """ Thread-safe queue of packages to download.
+        Available policies:
+            metalink:      Same order as the metalinks list
+            largest_first: Biggest packages first (longest processing time
+                           first), so a big package does not delay the end
+                           of the download
+            mixed:         Some workers download the biggest packages while
+                           the others fill the remaining slots with the
+                           smallest ones """
+
+    METALINK = 'metalink'
+    LARGEST_FIRST = 'largest_first'
+    MIXED = 'mixed'
+
+    POLICIES = [METALINK, LARGEST_FIRST, MIXED]
+
+    def __init__(self, elements, policy=LARGEST_FIRST, num_workers=1):
+        if policy not in DownloadScheduler.POLICIES:
+            logging.warning(
+                "Unknown download schedule policy '%s', using '%s'",
+                policy, DownloadScheduler.LARGEST_FIRST)
+            policy = DownloadScheduler.LARGEST_FIRST
+
+        self.policy = policy
+        self.num_workers = num_workers
+        self.lock = threading.Lock()
+
+        elements = list(elements)
+        if policy != DownloadScheduler.METALINK:
+            elements.sort(key=self.get_size, reverse=True)
+        self.elements = deque(elements)
+
+    @staticmethod
+    def get_size(element):
+        """ Returns package size (0 if unknown) """
+        try:
+            return int(element.get('size', 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def __len__(self):
+        return len(self.elements)
+
+    def get(self, worker_index=0):
+        """ Returns next element to be downloaded by worker_index worker
+            (None if there is nothing left) """
+        with self.lock:
+            if not self.elements:
+                return None
+            if self.policy == DownloadScheduler.MIXED:
+                # Half of the workers (at least one) take the biggest
+                # packages, the others take the smallest ones
+                big_workers = max(1, self.num_workers // 2)
+                if worker_index >= big_workers:
+                    return self.elements.pop()
+            return self.elements.popleft()
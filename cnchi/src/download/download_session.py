@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# download_session.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Pool of keep-alive http sessions (one for each host) """
+
+import logging
+import os
+import threading
+import urllib.parse
+
+import requests
+import requests.adapters
+
+import misc.extra as misc
+
+
+def get_host(url):
+    """ Returns the host part of an url (mirrors are told apart by it) """
+    return urllib.parse.urlsplit(url).netloc
+
+
+class SessionPool():
+    """ Thread-safe pool of requests sessions. Connections to the same
+        host (mirror) are reused, so we do not pay a new TCP (and TLS)
+        handshake for each downloaded file """
+
+    # Maximum number of connections kept alive for each host
+    POOL_MAXSIZE = 10
+
+    # Default timeout (seconds). By default, requests waits forever.
+    TIMEOUT = 30
+
+    def __init__(self, proxies=None, pool_maxsize=POOL_MAXSIZE):
+        """ Initialize pool. If no proxies are given, use the ones
+            set in the environment """
+        if proxies is None:
+            proxies = misc.get_proxies()
+        self.proxies = proxies or {}
+        self.pool_maxsize = pool_maxsize
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+        if self.proxies:
+            logging.debug("Http sessions will use these proxy settings: %s", self.proxies)
+
+    @staticmethod
+    def get_session_key(url):
+        """ Returns scheme and host part of an url """
+        parts = urllib.parse.urlsplit(url)
+        return "{0}://{1}".format(parts.scheme, parts.netloc)
+
+    def new_session(self):
+        """ Creates a new requests session """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.proxies.update(self.proxies)
+        session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        return session
+
+    def get_session(self, url):
+        """ Returns the session used to connect to url's host """
+        host = self.get_session_key(url)
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = self.new_session()
+                self.sessions[host] = session
+            return session
+
+    def set_proxies(self, proxies):
+        """ Changes proxy settings of all sessions """
+        with self.lock:
+            self.proxies = proxies or {}
+            for session in self.sessions.values():
+                session.proxies.clear()
+                session.proxies.update(self.proxies)
+
+    def get(self, url, **kwargs):
+        """ Sends a GET request to url (reusing a connection if possible) """
+        kwargs.setdefault('timeout', SessionPool.TIMEOUT)
+        return self.get_session(url).get(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """ Sends a HEAD request to url (reusing a connection if possible) """
+        kwargs.setdefault('timeout', SessionPool.TIMEOUT)
+        return self.get_session(url).head(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """ Sends a POST request to url (reusing a connection if possible) """
+        kwargs.setdefault('timeout', SessionPool.TIMEOUT)
+        return self.get_session(url).post(url, **kwargs)
+
+    def close(self):
+        """ Closes all sessions """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+# Shared pool (one for each process, connections can't be shared
+# between processes)
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """ Returns the shared session pool """
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != os.getpid():
+            _POOL = SessionPool()
+            _POOL_PID = os.getpid()
+        return _POOL
+
+
+def get(url, **kwargs):
+    """ Sends a GET request using the shared session pool """
+    return get_pool().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    """ Sends a HEAD request using the shared session pool """
+    return get_pool().head(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """ Sends a POST request using the shared session pool """
+    return get_pool().post(url, **kwargs)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# download_stats.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Stores download metrics and writes them to a json report """
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import download.download_session as download_session
+except ModuleNotFoundError:
+    import download_session
+
+
+class MirrorMetrics():
+    """ Download metrics of one mirror """
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.hash_failures = 0
+        self.bytes = 0
+        # Seconds spent receiving data
+        self.seconds = 0.0
+        # Time to first byte (sum, so we can get the average)
+        self.ttfb = 0.0
+        self.max_ttfb = 0.0
+        # A LAN package cache, not a mirror
+        self.peer = False
+
+    def to_dict(self):
+        """ Returns metrics as a dict (to be saved as json) """
+        if self.seconds > 0:
+            throughput = self.bytes / self.seconds
+        else:
+            throughput = 0
+        if self.requests > 0:
+            avg_ttfb = self.ttfb / self.requests
+        else:
+            avg_ttfb = 0
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'hash_failures': self.hash_failures,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 3),
+            'throughput': round(throughput, 1),
+            'avg_ttfb': round(avg_ttfb, 3),
+            'max_ttfb': round(self.max_ttfb, 3),
+            'peer': self.peer}
+
+
+class DownloadStats():
+    """ Thread-safe store of download metrics """
+
+    LOG_FOLDER = '/var/log/cnchi'
+    REPORT_FILENAME = 'cnchi-downloads.json'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mirrors = {}
+        self.retries = 0
+        self.hash_failures = 0
+        # Packages found in pacman's cache, in a xz cache dir, in a LAN
+        # package cache or downloaded from a mirror
+        self.cache_hits = {'pacman': 0, 'xz': 0, 'peer': 0}
+        self.cache_misses = 0
+        self.packages = 0
+        self.failed_packages = []
+        # Set by start(), so building the download list is not counted
+        self.start_time = None
+        self.end_time = None
+        # Download settings (workers, segments...), stored in the report
+        self.options = {}
+
+    def get_mirror(self, url):
+        """ Returns url's mirror metrics (the caller must hold the lock) """
+        host = download_session.get_host(url)
+        if host not in self.mirrors:
+            self.mirrors[host] = MirrorMetrics()
+        return self.mirrors[host]
+
+    def add_peer(self, url):
+        """ Marks url's host as a LAN package cache """
+        with self.lock:
+            self.get_mirror(url).peer = True
+
+    def add_request(self, url, ttfb):
+        """ Stores a request and its time to first byte (seconds) """
+        with self.lock:
+            mirror = self.get_mirror(url)
+            mirror.requests += 1
+            mirror.ttfb += ttfb
+            mirror.max_ttfb = max(mirror.max_ttfb, ttfb)
+
+    def add_transfer(self, url, size, seconds):
+        """ Stores size bytes received from url in seconds """
+        with self.lock:
+            mirror = self.get_mirror(url)
+            mirror.bytes += size
+            mirror.seconds += seconds
+
+    def add_failure(self, url):
+        """ Stores a failed request """
+        with self.lock:
+            self.get_mirror(url).failures += 1
+
+    def add_hash_failure(self, url):
+        """ Stores a file downloaded from url with a wrong hash """
+        with self.lock:
+            self.get_mirror(url).hash_failures += 1
+            self.hash_failures += 1
+
+    def add_retry(self):
+        """ Stores that a package had to be requested again """
+        with self.lock:
+            self.retries += 1
+
+    def add_cache_hit(self, cache):
+        """ Stores a package found in a cache ('pacman', 'xz' or 'peer') """
+        with self.lock:
+            self.packages += 1
+            self.cache_hits[cache] += 1
+
+    def add_cache_miss(self):
+        """ Stores a package that had to be downloaded """
+        with self.lock:
+            self.packages += 1
+            self.cache_misses += 1
+
+    def add_failed_package(self, filename):
+        """ Stores a package that couldn't be downloaded """
+        with self.lock:
+            self.failed_packages.append(filename)
+
+    def start(self):
+        """ Marks the start of the download run """
+        self.start_time = time.time()
+        self.end_time = None
+
+    def finish(self):
+        """ Marks the end of the download run """
+        self.end_time = time.time()
+
+    def to_dict(self):
+        """ Returns all metrics as a dict """
+        with self.lock:
+            end_time = self.end_time or time.time()
+            start_time = self.start_time or end_time
+            total_bytes = sum(mirror.bytes for mirror in self.mirrors.values())
+            return {
+                'start': start_time,
+                'end': end_time,
+                'seconds': round(end_time - start_time, 3),
+                'options': self.options,
+                'packages': self.packages,
+                'cache_hits': dict(self.cache_hits),
+                'cache_misses': self.cache_misses,
+                'failed_packages': list(self.failed_packages),
+                'retries': self.retries,
+                'hash_failures': self.hash_failures,
+                'bytes': total_bytes,
+                'mirrors': {
+                    host: mirror.to_dict()
+                    for host, mirror in self.mirrors.items()}}
+
+    def write_report(self, path=None):
+        """ Writes metrics to a json file (next to cnchi.log by default) """
+        if path is None:
+            path = os.path.join(DownloadStats.LOG_FOLDER, DownloadStats.REPORT_FILENAME)
+        try:
+            with open(path, 'w') as report_file:
+                json.dump(self.to_dict(), report_file, indent=2, sort_keys=True)
+            logging.debug("Download report written to %s", path)
+        except OSError as err:
+            logging.warning("Can't write download report %s: %s", path, err)
@@ -34,7 +34,6 @@ import logging
 import tempfile
 import os
 
-import hashlib
 import re
 import argparse
 
@@ -43,9 +42,21 @@ from collections import deque
 from xml.dom.minidom import getDOMImplementation
 import xml.etree.cElementTree as elementTree
 
-import pyalpm
 
-MAX_URLS = 15
+try:
+    import download.checksum as checksum
+    import download.download_plan as download_plan
+    import pacman.handle_manager as handle_manager
+except ModuleNotFoundError:
+    import sys
+    CNCHI_PATH = "/usr/share/cnchi"
+    sys.path.append(CNCHI_PATH)
+    sys.path.append(os.path.join(CNCHI_PATH, "src"))
+    import checksum
+    import download_plan
+    import pacman.handle_manager as handle_manager
+
+MAX_URLS = download_plan.MAX_URLS
 
 
 def get_info(metalink):
@@ -96,15 +107,48 @@ def get_info(metalink):
 def create(alpm, package_name, pacman_conf_file):
     """ Creates a metalink to download package_name and its dependencies """
 
+    download_queue = create_download_queue(alpm, [package_name], pacman_conf_file)
+
+    if download_queue:
+        metalink = download_queue_to_metalink(download_queue)
+        return metalink
+
+    logging.error("Unable to create download queue for package %s", package_name)
+    return None
+
+
+def create_plan(alpm, package_names, pacman_conf_file, progress_callback=None,
+                mirror_rank=None):
+    """ Creates a download plan (in memory, no xml is involved) to
+        download all package_names and their dependencies. All packages
+        are resolved at once, so shared dependencies are only walked once.
+        progress_callback(done, total) is called while resolving them.
+        If given, package urls are sorted with mirror_rank (MirrorRank) """
+
+    download_queue = create_download_queue(
+        alpm, package_names, pacman_conf_file, progress_callback, mirror_rank)
+
+    if download_queue:
+        return download_plan.DownloadPlan.from_download_queue(download_queue)
+
+    logging.error("Unable to create download queue")
+    return None
+
+
+def create_download_queue(alpm, package_names, pacman_conf_file, progress_callback=None,
+                          mirror_rank=None):
+    """ Creates a download queue for package_names and their dependencies """
+
     options = ["--conf", pacman_conf_file, "--noconfirm", "--all-deps"]
 
-    if package_name == "databases":
+    if package_names == ["databases"]:
         options.append("--refresh")
     else:
-        options.append(package_name)
+        options.extend(package_names)
 
     download_queue, not_found, missing_deps = build_download_queue(
-        alpm, args=options)
+        alpm, args=options, progress_callback=progress_callback,
+        mirror_rank=mirror_rank)
 
     if not_found:
         not_found = sorted(not_found)
@@ -118,12 +162,7 @@ def create(alpm, package_name, pacman_conf_file):
         logging.error(msg)
         return None
 
-    if download_queue:
-        metalink = download_queue_to_metalink(download_queue)
-        return metalink
-
-    logging.error("Unable to create download queue for package %s", package_name)
-    return None
+    return download_queue
 
 # From here comes modified code from pm2ml
 # pm2ml is Copyright (C) 2012-2013 Xyne
@@ -142,6 +181,16 @@ def download_queue_to_metalink(download_queue):
     return metalink
 
 
+def plan_to_metalink(plan):
+    """ Converts a download_plan.DownloadPlan object to a metalink """
+    metalink = Metalink()
+
+    for entry in plan:
+        metalink.add_entry(entry)
+
+    return metalink
+
+
 class Metalink():
     """ Metalink class """
 
@@ -189,11 +238,38 @@ class Metalink():
             tag.appendChild(val)
             for key, val in attrs:
                 tag.setAttribute(key, val)
+        # Repository name (needed to ask LAN package caches)
+        tag = self.doc.createElement('repo')
+        file_.appendChild(tag)
+        tag.appendChild(self.doc.createTextNode(pkg.db.name))
         urls = list(urls)
         self.add_urls(file_, urls)
         if sigs:
             self.add_file(pkg.filename + '.sig', (u + '.sig' for u in urls))
 
+    def add_entry(self, entry):
+        """Add a download plan entry."""
+        file_ = self.doc.createElement("file")
+        file_.setAttribute("name", entry.filename)
+        self.files.appendChild(file_)
+        values = [
+            ('identity', entry.identity, ()),
+            ('size', entry.size, ()),
+            ('version', entry.version, ()),
+            ('description', entry.description, ())]
+        for hash_type, hash_value in entry.hash.items():
+            values.append(('hash', hash_value, (('type', hash_type),)))
+        values.append(('repo', entry.repo, ()))
+        for tag, value, attrs in values:
+            tag = self.doc.createElement(tag)
+            file_.appendChild(tag)
+            tag.appendChild(self.doc.createTextNode(str(value)))
+            for key, val in attrs:
+                tag.setAttribute(key, val)
+        self.add_urls(file_, entry.urls)
+        if entry.sig_urls:
+            self.add_file(entry.filename + '.sig', entry.sig_urls)
+
     def add_file(self, name, urls):
         """Add a signature file."""
         file_ = self.doc.createElement("file")
@@ -322,41 +398,39 @@ def get_antergos_repo_pkgs(alpm_handle):
         logging.error("Cannot sync Antergos repository database!")
         return {}, None
 
-    group_names = ['mate', 'mate-extra']
-    groups = []
-    for group_name in group_names:
-        group = antdb.read_grp(group_name)
-        if not group:
-            # Group does not exist
-            group = ['None', []]
-        groups.append(group)
+    index = handle_manager.get_manager().get_index(alpm_handle)
+    antergos_index = index.get_db_index('antergos')
 
+    group_names = ['mate', 'mate-extra']
     repo_pkgs = {
-        pkg for group in groups
-        for pkg in group[1] if group}
+        pkg.name for group_name in group_names
+        for pkg in antergos_index.get_group_pkgs(group_name) or []}
 
     return repo_pkgs, antdb
 
 
-def resolve_deps(alpm_handle, other, alldeps):
-    """ Resolve dependencies """
+def resolve_deps(alpm_handle, other, alldeps, progress_callback=None):
+    """ Resolve dependencies. If given, progress_callback(done, total)
+        is called after each package is processed """
     missing_deps = []
     queue = deque(other)
-    local_cache = alpm_handle.get_localdb().pkgcache
-    syncdbs = alpm_handle.get_syncdbs()
-    seen = set(queue)
+    # Name and provides index (no need to scan each db for each dependency)
+    index = handle_manager.get_manager().get_index(alpm_handle)
+    seen = set(pkg.name for pkg in queue)
+    done = 0
     while queue:
         pkg = queue.popleft()
+        done += 1
+        if progress_callback:
+            progress_callback(done, done + len(queue))
         for dep in pkg.depends:
-            if pyalpm.find_satisfier(local_cache, dep) is None or alldeps:
-                for database in syncdbs:
-                    prov = pyalpm.find_satisfier(database.pkgcache, dep)
-                    if prov:
-                        other.add(prov)
-                        if prov.name not in seen:
-                            seen.add(prov.name)
-                            queue.append(prov)
-                        break
+            if alldeps or index.find_local_satisfier(dep) is None:
+                prov = index.find_sync_satisfier(dep)
+                if prov:
+                    other.add(prov)
+                    if prov.name not in seen:
+                        seen.add(prov.name)
+                        queue.append(prov)
                 else:
                     missing_deps.append(dep)
     return other, missing_deps
@@ -368,29 +442,30 @@ def create_package_set(requested, ant_repo_pkgs, antdb, alpm_handle):
     found = set()
     other = PkgSet()
 
-    for pkg in requested:
-        for database in alpm_handle.get_syncdbs():
-            # if pkg is in antergos repo, fetch it from it (instead of another repo)
-            # pkg should be sourced from the antergos repo only.
-            if antdb and pkg in ant_repo_pkgs and database.name != 'antergos':
-                database = antdb
-
-            syncpkg = database.get_pkg(pkg)
+    index = handle_manager.get_manager().get_index(alpm_handle)
+    antergos_index = None
+    if antdb:
+        antergos_index = index.get_db_index(antdb.name)
 
-            if syncpkg:
-                other.add(syncpkg)
-                break
-            else:
-                syncgrp = database.read_grp(pkg)
-                if syncgrp:
-                    found.add(pkg)
-                    #other_grp |= PkgSet(syncgrp[1])
-                    other |= PkgSet(syncgrp[1])
-                    break
+    for pkg in requested:
+        # if pkg is in antergos repo, fetch it from it (instead of another repo)
+        # pkg should be sourced from the antergos repo only.
+        if antergos_index and pkg in ant_repo_pkgs:
+            syncpkg = antergos_index.get_pkg(pkg)
+        else:
+            syncpkg = index.get_sync_pkg(pkg)
+
+        if syncpkg:
+            other.add(syncpkg)
+        else:
+            group_pkgs = index.get_group_pkgs(pkg)
+            if group_pkgs:
+                found.add(pkg)
+                other |= PkgSet(group_pkgs)
 
     return found, other
 
-def build_download_queue(alpm, args=None):
+def build_download_queue(alpm, args=None, progress_callback=None, mirror_rank=None):
     """ Function to build a download queue.
         Needs a pkgname in args """
 
@@ -415,7 +490,8 @@ def build_download_queue(alpm, args=None):
 
     # Resolve dependencies.
     if other and not pargs.nodeps:
-        other, missing_deps = resolve_deps(handle, other, pargs.alldeps)
+        other, missing_deps = resolve_deps(
+            handle, other, pargs.alldeps, progress_callback)
 
     found |= set(other.pkgs)
     not_found = requested - found
@@ -435,6 +511,9 @@ def build_download_queue(alpm, args=None):
             download_sig = needs_sig(siglevel, pargs.sigs, 'Database')
             download_queue.add_db(database, download_sig)
 
+    # Servers of each db, best mirrors first
+    db_servers = {}
+
     # Add packages (pkg, url, signature)
     for pkg in other:
         try:
@@ -443,8 +522,15 @@ def build_download_queue(alpm, args=None):
             siglevel = None
         download_sig = needs_sig(siglevel, pargs.sigs, 'Package')
 
+        server_urls = db_servers.get(pkg.db.name)
+        if server_urls is None:
+            server_urls = list(pkg.db.servers)
+            if mirror_rank:
+                # Sort them before dropping any url
+                server_urls = mirror_rank.rank_urls(server_urls)
+            db_servers[pkg.db.name] = server_urls
+
         urls = []
-        server_urls = list(pkg.db.servers)
         for server_url in server_urls:
             url = os.path.join(server_url, pkg.filename)
             urls.append(url)
@@ -460,35 +546,36 @@ def build_download_queue(alpm, args=None):
 
 def get_checksum(path, typ):
     """ Returns checksum of a file """
-    new_hash = hashlib.new(typ)
-    block_size = new_hash.block_size
     try:
-        with open(path, 'rb') as myfile:
-            buf = myfile.read(block_size)
-            while buf:
-                new_hash.update(buf)
-                buf = myfile.read(block_size)
-        return new_hash.hexdigest()
-    except FileNotFoundError:
-        return -1
+        real_checksum = checksum.get_file_hash(path, typ)
     except IOError as io_error:
         logging.error(io_error)
+        return None
+    if real_checksum is None:
+        return -1
+    return real_checksum
 
 
 def check_cache(conf, pkgs):
-    """ Checks package checksum in cache """
-    for pkg in pkgs:
-        for cache in conf.options['CacheDir']:
-            fpath = os.path.join(cache, pkg.filename)
-            for checksum in ('sha256', 'md5'):
-                real_checksum = get_checksum(fpath, checksum)
-                correct_checksum = getattr(pkg, checksum + 'sum')
-                if real_checksum is None or real_checksum != correct_checksum:
-                    yield pkg
-                    break
+    """ Checks package checksum in cache. Yields the packages that do not
+        have a valid file in every cache dir (like pm2ml does). Files of
+        each cache dir are hashed in parallel, reading each file once for
+        sha256 and md5, and only while the package is still valid """
+    valid = list(pkgs)
+    for cache in conf.options['CacheDir']:
+        paths = [os.path.join(cache, pkg.filename) for pkg in valid]
+        hashes = checksum.hash_files(
+            [path for path in paths if os.path.exists(path)], ('sha256', 'md5'))
+        still_valid = []
+        for pkg, path in zip(valid, paths):
+            real_checksums = hashes.get(path)
+            if real_checksums and all(
+                    real_checksums[typ] == getattr(pkg, typ + 'sum')
+                    for typ in ('sha256', 'md5')):
+                still_valid.append(pkg)
             else:
-                continue
-            break
+                yield pkg
+        valid = still_valid
 
 
 def needs_sig(siglevel, insistence, prefix):
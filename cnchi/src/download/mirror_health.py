@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mirror_health.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Keeps track of mirrors health while downloading packages """
+
+import logging
+import random
+import threading
+import time
+
+try:
+    import download.download_session as download_session
+except ModuleNotFoundError:
+    import download_session
+
+
+class MirrorStats():
+    """ Stores health info of one mirror """
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(self):
+        self.state = MirrorStats.CLOSED
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.successes = 0
+        # Exponentially weighted moving average of throughput (bytes/s)
+        self.throughput = None
+        # When the circuit was opened and for how long
+        self.opened_at = 0
+        self.cooldown = 0
+        # True while a half-open probe request is running
+        self.probing = False
+
+
+class MirrorHealth():
+    """ Thread-safe mirror health tracker. Mirrors that fail several
+        times in a row are not used for a while (circuit breaker) and
+        slow or failing ones are moved to the end of the url lists """
+
+    # Consecutive errors needed to stop using a mirror
+    MAX_CONSECUTIVE_ERRORS = 3
+
+    # Seconds before trying again a mirror that we stopped using
+    COOLDOWN = 30
+    MAX_COOLDOWN = 300
+
+    # Weight of the last measure in the throughput average
+    EWMA_ALPHA = 0.3
+
+    # Mirrors slower than this fraction of the fastest one are demoted
+    SLOW_FRACTION = 0.25
+
+    # Backoff between retries (seconds)
+    BACKOFF_BASE = 0.2
+    BACKOFF_MAX = 2.0
+
+    def __init__(self):
+        self.mirrors = {}
+        self.lock = threading.Lock()
+
+    def get_stats(self, url):
+        """ Returns url's mirror stats (the caller must hold the lock) """
+        host = download_session.get_host(url)
+        if host not in self.mirrors:
+            self.mirrors[host] = MirrorStats()
+        return self.mirrors[host]
+
+    def record_success(self, url, size, seconds):
+        """ Stores a successful download of size bytes in seconds """
+        with self.lock:
+            stats = self.get_stats(url)
+            stats.successes += 1
+            stats.consecutive_errors = 0
+            stats.probing = False
+            if stats.state != MirrorStats.CLOSED:
+                logging.debug("Mirror %s is working again", download_session.get_host(url))
+                stats.state = MirrorStats.CLOSED
+                stats.cooldown = 0
+            if size > 0 and seconds > 0:
+                rate = size / seconds
+                if stats.throughput is None:
+                    stats.throughput = rate
+                else:
+                    alpha = MirrorHealth.EWMA_ALPHA
+                    stats.throughput = alpha * rate + (1 - alpha) * stats.throughput
+
+    def record_failure(self, url):
+        """ Stores a failed download """
+        with self.lock:
+            stats = self.get_stats(url)
+            stats.errors += 1
+            stats.consecutive_errors += 1
+            stats.probing = False
+            if (stats.state == MirrorStats.HALF_OPEN or
+                    stats.consecutive_errors >= MirrorHealth.MAX_CONSECUTIVE_ERRORS):
+                if stats.state == MirrorStats.HALF_OPEN:
+                    stats.cooldown = min(stats.cooldown * 2, MirrorHealth.MAX_COOLDOWN)
+                else:
+                    stats.cooldown = MirrorHealth.COOLDOWN
+                stats.state = MirrorStats.OPEN
+                stats.opened_at = time.monotonic()
+                logging.debug(
+                    "Mirror %s will not be used for %d seconds",
+                    download_session.get_host(url), stats.cooldown)
+
+    def allow_request(self, url):
+        """ Checks if we can use url's mirror now. When the cooldown
+            of a disabled mirror has passed, one request is allowed to
+            check if it works again """
+        with self.lock:
+            stats = self.get_stats(url)
+            if stats.state == MirrorStats.CLOSED:
+                return True
+            if stats.state == MirrorStats.OPEN:
+                if time.monotonic() - stats.opened_at < stats.cooldown:
+                    return False
+                stats.state = MirrorStats.HALF_OPEN
+                stats.probing = False
+            if stats.probing:
+                # Another request is already checking this mirror
+                return False
+            stats.probing = True
+            return True
+
+    def sort_urls(self, urls):
+        """ Returns urls sorted by mirror health. Urls keep their
+            original (ranked) order inside each group """
+        with self.lock:
+            rates = [
+                stats.throughput for stats in self.mirrors.values()
+                if stats.throughput]
+            best_rate = max(rates) if rates else 0
+
+            def sort_key(index_url):
+                """ Sort helper """
+                index, url = index_url
+                if not url:
+                    return (MirrorStats.OPEN + 1, 0, 0, index)
+                stats = self.mirrors.get(download_session.get_host(url))
+                if stats is None:
+                    return (MirrorStats.CLOSED, 0, 0, index)
+                slow = bool(
+                    stats.throughput and
+                    stats.throughput < best_rate * MirrorHealth.SLOW_FRACTION)
+                return (stats.state, stats.consecutive_errors, slow, index)
+
+            return [url for _index, url in sorted(enumerate(urls), key=sort_key)]
+
+    @staticmethod
+    def backoff(attempt):
+        """ Waits a bit (with jitter) before the next retry """
+        delay = min(
+            MirrorHealth.BACKOFF_MAX,
+            MirrorHealth.BACKOFF_BASE * (2 ** attempt))
+        time.sleep(random.uniform(0.5, 1.5) * delay)
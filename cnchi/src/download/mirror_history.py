@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mirror_history.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Stores mirrors throughput and errors measured while downloading
+    packages, so future installs can use them to sort mirrors """
+
+import json
+import logging
+import os
+import time
+
+try:
+    import download.cache_copy as cache_copy
+    import download.download_session as download_session
+except ModuleNotFoundError:
+    import cache_copy
+    import download_session
+
+
+class MirrorHistory():
+    """ Persistent per mirror (host) download history """
+
+    # Used when there is no persistent xz cache dir (see get_history)
+    PATH = '/var/cache/cnchi/mirror-history.json'
+
+    # Filename of the history stored in a xz cache dir
+    FILENAME = '.cnchi-mirror-history.json'
+
+    # Entries older than this (seconds) are ignored
+    MAX_AGE = 30 * 24 * 3600
+
+    # Weight of the last install when updating stored values
+    ALPHA = 0.5
+
+    # Weight of the history when blending it with a new measure
+    HISTORY_WEIGHT = 0.5
+
+    def __init__(self, path=None):
+        self.path = path or MirrorHistory.PATH
+        self.mirrors = {}
+        self.load()
+
+    def load(self):
+        """ Loads history from disk, forgetting old entries """
+        try:
+            with open(self.path, 'r') as history_file:
+                mirrors = json.load(history_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            logging.warning("Can't read mirror history %s: %s", self.path, err)
+            return
+        now = time.time()
+        self.mirrors = {
+            host: entry for host, entry in mirrors.items()
+            if now - entry.get('updated', 0) < MirrorHistory.MAX_AGE}
+
+    def save(self):
+        """ Writes history to disk """
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o755, exist_ok=True)
+            with open(tmp_path, 'w') as history_file:
+                json.dump(self.mirrors, history_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logging.warning("Can't write mirror history %s: %s", self.path, err)
+
+    def update(self, stats):
+        """ Adds metrics of a download run (a DownloadStats object) """
+        alpha = MirrorHistory.ALPHA
+        now = time.time()
+        for host, metrics in stats.to_dict()['mirrors'].items():
+            if not metrics['requests'] or metrics.get('peer'):
+                # LAN package caches are not mirrors, they would
+                # outrank all of them
+                continue
+            # Connection errors are counted as failures but not as
+            # requests, so the ratio could be greater than one
+            failure_ratio = min(1.0, metrics['failures'] / metrics['requests'])
+            entry = self.mirrors.get(host)
+            if entry is None:
+                entry = {
+                    'throughput': metrics['throughput'],
+                    'failure_ratio': failure_ratio}
+            else:
+                if metrics['throughput']:
+                    entry['throughput'] = (
+                        alpha * metrics['throughput'] +
+                        (1 - alpha) * entry['throughput'])
+                entry['failure_ratio'] = (
+                    alpha * failure_ratio + (1 - alpha) * entry['failure_ratio'])
+            entry['updated'] = now
+            self.mirrors[host] = entry
+
+    def get_rate(self, url):
+        """ Returns url's mirror observed throughput (bytes/s), lowered by
+            its failure ratio. Returns None if we know nothing about it """
+        entry = self.mirrors.get(download_session.get_host(url))
+        if entry is None:
+            return None
+        failure_ratio = min(1.0, max(0.0, entry['failure_ratio']))
+        return entry['throughput'] * (1 - failure_ratio)
+
+    def blend(self, url, rate):
+        """ Blends a measured rate (bytes/s) with url's mirror history """
+        history_rate = self.get_rate(url)
+        if history_rate is None:
+            return rate
+        weight = MirrorHistory.HISTORY_WEIGHT
+        return weight * history_rate + (1 - weight) * rate
+
+
+def get_history(xz_cache_dirs=None):
+    """ Returns the mirror history. It is stored in the first writable
+        xz cache dir (unlike the live system, they're kept between
+        installs). If there is none, PATH is used """
+    for xz_cache_dir in xz_cache_dirs or []:
+        if xz_cache_dir == cache_copy.CopyService.PACMAN_ISO_CACHE:
+            continue
+        if os.path.isdir(xz_cache_dir) and os.access(xz_cache_dir, os.W_OK):
+            return MirrorHistory(os.path.join(xz_cache_dir, MirrorHistory.FILENAME))
+    return MirrorHistory()
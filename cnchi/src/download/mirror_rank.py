@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mirror_rank.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Sorts package urls by mirror rank """
+
+try:
+    import download.download_session as download_session
+    import download.mirror_history as mirror_history
+except ModuleNotFoundError:
+    import download_session
+    import mirror_history
+
+
+class MirrorRank():
+    """ Precomputed mirror host -> rank map (from rankmirrors' result).
+        Mirrors that are not ranked are sorted by the throughput measured
+        in previous installs (see mirror_history) """
+
+    # Rank of mirrors that are not in the ranked list
+    UNRANKED = 9999
+
+    def __init__(self, ranked_urls=None, history=None):
+        self.ranks = {}
+        for rank, mirror_url in enumerate(ranked_urls or []):
+            if mirror_url:
+                self.ranks.setdefault(download_session.get_host(mirror_url), rank)
+        self.history = history
+
+    def get_key(self, url):
+        """ Returns url's sort key (lower is better) """
+        if not url:
+            return (MirrorRank.UNRANKED + 1, 0)
+        rank = self.ranks.get(download_session.get_host(url), MirrorRank.UNRANKED)
+        # Rankmirrors already takes mirror history into account. Use it
+        # to sort the mirrors that are not in the ranked list
+        rate = 0
+        if self.history:
+            rate = self.history.get_rate(url) or 0
+        return (rank, -rate)
+
+    def rank_urls(self, urls):
+        """ Returns urls sorted by mirror rank """
+        return sorted(urls, key=self.get_key)
+
+
+def get_mirror_rank(settings, history=None):
+    """ Returns the mirror rank of rankmirrors' result (stored in Cnchi
+        settings) and the mirror history """
+    ranked = None
+    xz_cache_dirs = None
+    if settings:
+        ranked = settings.get('rankmirrors_result')
+        xz_cache_dirs = settings.get('xz_cache')
+    if history is None:
+        history = mirror_history.get_history(xz_cache_dirs)
+    return MirrorRank(ranked, history)
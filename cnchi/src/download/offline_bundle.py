@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# offline_bundle.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Self-contained package repository image, used to install without
+    any network access """
+
+import logging
+import os
+import shutil
+
+try:
+    import download.cache_index as cache_index
+except ModuleNotFoundError:
+    import cache_index
+
+
+class OfflineBundle():
+    """ An offline bundle is a directory (usually a mounted squashfs image
+        or a directory in the ISO) with this layout:
+
+            sync/<repo>.db      Sync databases (and their .sig files)
+            pkg/*.pkg.tar.xz    Packages
+            pkg/sha256sums      Packages hashes (sha256sum output)
+            packages.xml        Cnchi packages list (optional)
+
+        Databases are installed instead of downloading them and the pkg
+        directory is used as a xz cache dir, so no network is needed """
+
+    SYNC_DIR = 'sync'
+    PKG_DIR = 'pkg'
+    PACKAGES_XML = 'packages.xml'
+
+    def __init__(self, path):
+        self.path = path
+        self.sync_dir = os.path.join(path, OfflineBundle.SYNC_DIR)
+        self.pkg_dir = os.path.join(path, OfflineBundle.PKG_DIR)
+
+    def is_valid(self):
+        """ Checks that bundle has sync databases and packages """
+        return os.path.isdir(self.sync_dir) and os.path.isdir(self.pkg_dir)
+
+    @property
+    def packages_xml(self):
+        """ Returns path of the bundled packages list (None if missing) """
+        path = os.path.join(self.path, OfflineBundle.PACKAGES_XML)
+        if os.path.exists(path):
+            return path
+        return None
+
+    @property
+    def has_sha256sums(self):
+        """ True if the bundle has a prebuilt hash index """
+        return os.path.exists(
+            os.path.join(self.pkg_dir, cache_index.CacheIndex.SHA256SUMS_FILENAME))
+
+    def install_sync_dbs(self, dbpath, repos):
+        """ Copies bundled sync databases of repos to pacman's dbpath
+            (as pacman -Sy would do). Returns False if any is missing """
+        dst_dir = os.path.join(dbpath, OfflineBundle.SYNC_DIR)
+        os.makedirs(dst_dir, mode=0o755, exist_ok=True)
+        res = True
+        for repo in repos:
+            found = False
+            for suffix in ('.db', '.db.sig'):
+                src = os.path.join(self.sync_dir, repo + suffix)
+                dst = os.path.join(dst_dir, repo + suffix)
+                if os.path.exists(src):
+                    shutil.copy2(src, dst)
+                    found = found or suffix == '.db'
+                elif suffix == '.db.sig' and os.path.exists(dst):
+                    # An old signature would not match the bundled database
+                    os.remove(dst)
+            if found:
+                logging.debug("Using %s database from offline bundle", repo)
+            else:
+                logging.error("Offline bundle %s has no %s database", self.path, repo)
+                res = False
+        return res
+
+
+def get_bundle(settings):
+    """ Returns offline bundle set in Cnchi settings (None if there is none) """
+    path = settings.get('offline_bundle')
+    if not path:
+        return None
+    bundle = OfflineBundle(path)
+    if not bundle.is_valid():
+        logging.warning("%s is not a valid offline bundle", path)
+        return None
+    return bundle
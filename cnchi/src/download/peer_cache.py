@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# peer_cache.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Gets packages from package caches of other computers in the LAN
+    (pacserve-like http servers) before using the mirrors """
+
+import json
+import logging
+import os
+import platform
+import socket
+import time
+
+try:
+    import download.download_hash as dhash
+except ModuleNotFoundError:
+    import download_hash as dhash
+
+
+class PeerCache():
+    """ List of LAN http package caches. Each server is a base url
+        (for instance http://192.168.1.10:15678/pacman/$repo/$arch).
+        As in pacman.conf, $repo and $arch are replaced with the package's
+        repository and architecture. If the url has no variables, the
+        package filename is just appended to it.
+
+        Peers are never trusted: downloaded files are always checked
+        against the sha256 stored in the metalink """
+
+    # pacserve default port
+    DEFAULT_PORT = 15678
+
+    # Discovery: we send QUERY to this multicast group and every peer
+    # answers (unicast) with its base url
+    MULTICAST_GROUP = '239.255.15.78'
+    MULTICAST_PORT = 15679
+    QUERY = b'cnchi-peer-cache'
+
+    # Seconds to wait for answers when discovering peers
+    DISCOVERY_TIMEOUT = 1.0
+
+    # Peers are in the LAN, they should answer very fast (seconds)
+    TIMEOUT = 5
+
+    def __init__(self, servers=None):
+        self.servers = []
+        self.arch = platform.machine()
+        for server in servers or []:
+            self.add_server(server)
+
+    def __bool__(self):
+        return bool(self.servers)
+
+    def add_server(self, server):
+        """ Adds a peer (base url) """
+        if not server:
+            return
+        if not server.startswith(('http://', 'https://')):
+            server = 'http://{0}:{1}/pacman/$repo/$arch'.format(
+                server, PeerCache.DEFAULT_PORT)
+        server = server.rstrip('/')
+        if server not in self.servers:
+            logging.debug("Using %s as a LAN package cache", server)
+            self.servers.append(server)
+
+    def load_powerpill_conf(self, path):
+        """ Adds pacserve server configured in powerpill.json (if any) """
+        try:
+            with open(path, 'r') as conf_file:
+                conf = json.load(conf_file)
+        except (OSError, ValueError) as err:
+            logging.debug("Can't read %s: %s", path, err)
+            return
+        server = conf.get('pacserve', {}).get('server')
+        if server:
+            self.add_server(server)
+
+    def discover(self, timeout=DISCOVERY_TIMEOUT):
+        """ Looks for peers in the LAN (multicast query) """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.settimeout(timeout)
+            sock.sendto(
+                PeerCache.QUERY,
+                (PeerCache.MULTICAST_GROUP, PeerCache.MULTICAST_PORT))
+            end_time = time.monotonic() + timeout
+            while True:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    data, address = sock.recvfrom(1024)
+                except socket.timeout:
+                    break
+                server = data.decode('utf-8', 'ignore').strip()
+                if not server:
+                    # Peer did not tell us its url, use pacserve's default
+                    server = address[0]
+                self.add_server(server)
+        except OSError as err:
+            logging.debug("Can't look for LAN package caches: %s", err)
+        finally:
+            sock.close()
+
+    def get_urls(self, element):
+        """ Returns element's urls in all peers """
+        # Without a hash we can't check what peers send us
+        if not dhash.get_element_hash(element, 'sha256'):
+            return []
+        repo = element.get('repo') or 'any'
+        urls = []
+        for server in self.servers:
+            if '$repo' in server or '$arch' in server:
+                base_url = server.replace('$repo', repo).replace('$arch', self.arch)
+            else:
+                base_url = server
+            urls.append(base_url + '/' + element['filename'])
+        return urls
+
+
+def get_peer_cache(settings):
+    """ Creates peer cache list from Cnchi settings """
+    peer_cache = PeerCache(settings.get('peer_cache_servers'))
+    data_dir = settings.get('data')
+    if data_dir:
+        peer_cache.load_powerpill_conf(os.path.join(data_dir, 'powerpill.json'))
+    if settings.get('peer_cache_discovery'):
+        peer_cache.discover()
+    return peer_cache
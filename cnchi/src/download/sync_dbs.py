@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# cache_index.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+""" Downloads the sync databases (core.db, extra.db...) concurrently """
+
+import concurrent.futures
+import email.utils
+import io
+import logging
+import os
+
+import requests
+
+try:
+    import download.download_session as download_session
+except ModuleNotFoundError:
+    import download_session
+
+
+class SyncDbDownloader():
+    """ Downloads all sync databases of an alpm handle at the same time,
+        reusing the shared http sessions. Mirrors are tried in mirror rank
+        order. If not forced, databases that have not changed since they
+        were last downloaded are not transferred (If-Modified-Since) """
+
+    # Seconds to wait for a mirror
+    TIMEOUT = 10
+
+    MAX_WORKERS = 6
+
+    def __init__(self, dbpath, mirror_rank=None, force=True, max_workers=MAX_WORKERS):
+        self.sync_dir = os.path.join(dbpath, 'sync')
+        self.mirror_rank = mirror_rank
+        self.force = force
+        self.max_workers = max_workers
+        self.sessions = download_session.get_pool()
+
+    def refresh(self, databases):
+        """ Downloads databases (pyalpm db objects). Returns True
+            if all of them have been updated (or are up to date) """
+        databases = list(databases)
+        if not databases:
+            return True
+
+        os.makedirs(self.sync_dir, mode=0o755, exist_ok=True)
+
+        num_workers = min(self.max_workers, len(databases))
+        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+            results = executor.map(
+                lambda database: self.refresh_db(database.name, database.servers),
+                databases)
+            return all(list(results))
+
+    def refresh_db(self, db_name, servers):
+        """ Downloads db_name database from the first mirror that works """
+        if self.mirror_rank:
+            servers = self.mirror_rank.rank_urls(servers)
+
+        filename = db_name + '.db'
+        path = os.path.join(self.sync_dir, filename)
+
+        for server in servers:
+            url = '{0}/{1}'.format(server.rstrip('/'), filename)
+            try:
+                if self.download_file(url, path):
+                    logging.debug("%s database downloaded from %s", db_name, url)
+                    self.download_signature(url, path)
+                else:
+                    logging.debug("%s database is up to date", db_name)
+                return True
+            except (OSError, requests.RequestException) as err:
+                logging.warning("Can't download %s: %s", url, err)
+
+        logging.error("Can't download %s database from any mirror", db_name)
+        return False
+
+    def download_file(self, url, path):
+        """ Downloads url to path. Returns False (and does not download
+            anything) if path is already up to date """
+        headers = {}
+        if not self.force and os.path.exists(path):
+            headers['If-Modified-Since'] = email.utils.formatdate(
+                os.path.getmtime(path), usegmt=True)
+
+        with self.sessions.get(
+                url, stream=True, timeout=SyncDbDownloader.TIMEOUT,
+                headers=headers) as req:
+            if req.status_code == requests.codes.not_modified:
+                return False
+            req.raise_for_status()
+
+            tmp_path = path + '.part'
+            with open(tmp_path, 'wb') as db_file:
+                for data in req.iter_content(io.DEFAULT_BUFFER_SIZE):
+                    db_file.write(data)
+
+            # Store mirror's modification time, as pacman does, so next
+            # If-Modified-Since requests compare against it
+            last_modified = req.headers.get('last-modified')
+            if last_modified:
+                try:
+                    mtime = email.utils.parsedate_to_datetime(last_modified).timestamp()
+                    os.utime(tmp_path, (mtime, mtime))
+                except (TypeError, ValueError):
+                    pass
+
+            os.replace(tmp_path, path)
+        return True
+
+    def download_signature(self, db_url, db_path):
+        """ Downloads database signature (if the mirror has it). An old
+            signature would not match the new database, so it is removed """
+        sig_path = db_path + '.sig'
+        try:
+            os.remove(sig_path)
+        except FileNotFoundError:
+            pass
+        try:
+            self.download_file(db_url + '.sig', sig_path)
+        except (OSError, requests.RequestException) as err:
+            logging.debug("No signature for %s: %s", db_url, err)
@@ -29,10 +29,14 @@ import logging
 import os
 import shutil
 import sys
+import threading
 
 from mako.template import Template
 
+from download import db_snapshot
 from download import download
+from download import mirror_rank
+from download import offline_bundle
 
 from installation import special_dirs
 from installation import post_install
@@ -292,14 +296,21 @@ class Installation():
             message = template.format(type(ex).__name__, ex.args)
             logging.error(message)
 
-        logging.debug("Downloading packages...")
-        self.download_packages()
+        if self.settings.get('pipelined_install'):
+            # This mounts (binds) /dev and others to /DEST_DIR/dev and others
+            special_dirs.mount(DEST_DIR)
 
-        # This mounts (binds) /dev and others to /DEST_DIR/dev and others
-        special_dirs.mount(DEST_DIR)
+            logging.debug("Downloading and installing packages...")
+            self.download_and_install_packages()
+        else:
+            logging.debug("Downloading packages...")
+            self.download_packages()
 
-        logging.debug("Installing packages...")
-        self.install_packages()
+            # This mounts (binds) /dev and others to /DEST_DIR/dev and others
+            special_dirs.mount(DEST_DIR)
+
+            logging.debug("Installing packages...")
+            self.install_packages()
 
         logging.debug("Configuring system...")
         post = post_install.PostInstallation(
@@ -335,7 +346,7 @@ class Installation():
         self.error = False
         return True
 
-    def download_packages(self):
+    def download_packages(self, package_ready=None):
         """ Downloads necessary packages """
 
         self.pacman_cache_dir = os.path.join(DEST_DIR, 'var/cache/pacman/pkg')
@@ -353,7 +364,100 @@ class Installation():
         # Metalinks have already been calculated before,
         # When downloadpackages class has been called in process.py to test
         # that Cnchi was able to create it before partitioning/formatting
-        download_packages.start_download(self.metalinks)
+        download_packages.start_download(self.metalinks, package_ready)
+
+    def get_explicit_packages(self):
+        """ Returns the names of the packages (and the members of the
+            groups) the user has asked for (not just dependencies) """
+        explicit = set()
+        for name in self.packages:
+            explicit.add(name)
+            group_pkgs = self.pacman.get_group_pkgs(name)
+            if group_pkgs:
+                explicit.update(pkg.name for pkg in group_pkgs)
+        return explicit
+
+    def download_and_install_packages(self):
+        """ Installs packages in dependency ordered batches while the
+            rest of them are still being downloaded """
+        self.add_xz_cache_dirs()
+
+        # Split all packages in batches. Each batch only
+        # depends on packages of the previous ones
+        pkg_names = [element['identity'] for element in self.metalinks.values()]
+        batches = self.pacman.get_dependency_batches(pkg_names)
+        explicit = self.get_explicit_packages()
+
+        logging.debug(
+            "Packages will be installed in %d batches while downloading", len(batches))
+
+        ready = set()
+        condition = threading.Condition()
+        download_status = {'finished': False, 'error': None}
+
+        def package_ready(element):
+            """ Called by the download threads """
+            with condition:
+                ready.add(element['identity'])
+                condition.notify_all()
+
+        def download_thread():
+            """ Downloads all packages """
+            try:
+                self.download_packages(package_ready)
+            except Exception as ex:
+                download_status['error'] = ex
+            with condition:
+                download_status['finished'] = True
+                condition.notify_all()
+
+        downloader = threading.Thread(target=download_thread)
+        downloader.start()
+
+        pipeline_ok = True
+        for batch in batches:
+            with condition:
+                condition.wait_for(
+                    lambda: download_status['finished'] or ready.issuperset(batch))
+                if not ready.issuperset(batch):
+                    # Download has finished (or failed) without these packages
+                    pipeline_ok = False
+                    break
+
+            # Explicit packages first (the dependencies they pull in are
+            # installed as dependencies), then the rest of dependencies.
+            # A dependency may depend on an explicit package of the same
+            # batch, installing dependencies first would mark it as a
+            # dependency too
+            targets = [name for name in batch if name in explicit]
+            try:
+                if targets:
+                    pipeline_ok = self.pacman.install(pkgs=targets)
+                local_index = self.pacman.get_index().local
+                dependencies = [
+                    name for name in batch
+                    if name not in explicit and local_index.get_pkg(name) is None]
+                if pipeline_ok and dependencies:
+                    options = {'mode': pac.pyalpm.PKG_REASON_DEPEND}
+                    pipeline_ok = self.pacman.install(pkgs=dependencies, options=options)
+            except pac.pyalpm.error:
+                pipeline_ok = False
+
+            if not pipeline_ok:
+                logging.warning("Can't install a batch of packages while downloading")
+                break
+
+        downloader.join()
+
+        if download_status['error']:
+            raise download_status['error']
+
+        if pipeline_ok:
+            # All downloading and installing has been done, so we hide progress bar
+            self.events.add('progress_bar', 'hide')
+        else:
+            # Everything is downloaded now, try the usual way
+            self.install_packages()
 
     def create_pacman_conf_file(self):
         """ Creates a temporary pacman.conf """
@@ -398,9 +502,19 @@ class Installation():
             raise InstallError(message)
 
         # Refresh pacman databases
-        if not self.pacman.refresh():
+        # Databases downloaded when selecting packages are copied
+        # instead of downloaded again (if they're still fresh)
+        snapshot = db_snapshot.get_snapshot(self.settings)
+        refreshed = self.pacman.refresh(
+            offline_bundle.get_bundle(self.settings),
+            parallel=True,
+            force=False,
+            mirror_rank=mirror_rank.get_mirror_rank(self.settings),
+            snapshot=snapshot)
+        if not refreshed:
             logging.error("Can't refresh pacman databases.")
             raise InstallError(_("Can't refresh pacman databases."))
+        db_snapshot.save_snapshot(self.settings, snapshot)
 
     @staticmethod
     def prepare_pacman_keyring():
@@ -468,13 +582,19 @@ class Installation():
                     line = 'Server = http://repo.antergos.info/$repo/$arch'
                 new_pacman_conf.write(line)
 
-    def install_packages(self):
-        """ Start pacman installation of packages """
-        result = False
+    def add_xz_cache_dirs(self):
+        """ Tells alpm to also look for packages in the xz cache dirs """
         # This shouldn't be necessary if download.py really downloaded all
         # needed packages, but it does not do it (why?)
+        cache_dirs = self.pacman.handle.cachedirs
         for cache_dir in self.settings.get('xz_cache'):
-            self.pacman.handle.add_cachedir(cache_dir)
+            if cache_dir not in cache_dirs:
+                self.pacman.handle.add_cachedir(cache_dir)
+
+    def install_packages(self):
+        """ Start pacman installation of packages """
+        result = False
+        self.add_xz_cache_dirs()
 
         logging.debug("Installing packages...")
 
@@ -490,7 +610,9 @@ class Installation():
             logging.warning(
                 "Can't install necessary packages. Let's try again deleting stale packages first.")
             self.delete_stale_pkgs(stale_pkgs)
-            self.pacman.refresh()
+            # Stale databases could also be the cause, download them again
+            # (a fresh snapshot would just restore the same ones)
+            self.pacman.refresh(force=True)
             try:
                 result = self.pacman.install(pkgs=self.packages)
             except pac.pyalpm.error:
@@ -26,14 +26,17 @@
 
 import logging
 import os
-import subprocess
-import requests
 from requests.exceptions import RequestException
 
 import xml.etree.cElementTree as elementTree
 
 import desktop_info
 
+from download import db_snapshot
+from download import download_session
+from download import mirror_rank
+from download import offline_bundle
+
 import pacman.pac as pac
 
 from misc.events import Events
@@ -116,10 +119,19 @@ class SelectPackages():
             raise InstallError(message)
 
         # Refresh pacman databases
-        if not pacman.refresh():
+        # Store downloaded databases, so the installation can reuse them
+        snapshot = db_snapshot.get_snapshot(self.settings)
+        refreshed = pacman.refresh(
+            offline_bundle.get_bundle(self.settings),
+            parallel=True,
+            force=False,
+            mirror_rank=mirror_rank.get_mirror_rank(self.settings),
+            snapshot=snapshot)
+        if not refreshed:
             logging.error("Can't refresh pacman databases.")
             txt = _("Can't refresh pacman databases.")
             raise InstallError(txt)
+        db_snapshot.save_snapshot(self.settings, snapshot)
 
         try:
             pacman.release()
@@ -185,7 +197,7 @@ class SelectPackages():
         url = SelectPackages.PKGLIST_URL
         logging.debug("Getting url %s...", url)
         try:
-            req = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
+            req = download_session.get(url)
             self.xml_root = elementTree.fromstring(req.content)
         except RequestException as url_error:
             msg = "Can't retrieve remote package list: {}".format(
@@ -201,7 +213,12 @@ class SelectPackages():
             # Use file passed by parameter (overrides server one)
             self.load_xml_local(alternate_package_list)
 
-        if self.xml_root is None:
+        bundle = offline_bundle.get_bundle(self.settings)
+        if self.xml_root is None and bundle and bundle.packages_xml:
+            # Offline install, use the list stored in the bundle
+            self.load_xml_local(bundle.packages_xml)
+
+        if self.xml_root is None and bundle is None:
             # The list of packages is retrieved from an online XML to let us
             # control the pkgname in case of any modification
             self.load_xml_remote()
@@ -366,32 +383,36 @@ class SelectPackages():
         # This is done mainly to avoid errors when Arch removes a package silently
         self.check_packages()
 
+    @misc.raise_privileges
     def check_packages(self):
         """ Checks that all selected packages ARE in the repositories """
-        not_found = []
         self.events.add('percent', 0)
         self.events.add('info', _("Checking that all selected packages are available online..."))
-        num_pkgs = len(self.packages)
-        for index, pkg_name in enumerate(self.packages):
-            # TODO: Use libalpm instead
-            cmd = ["/usr/bin/pacman", "-Ss", pkg_name]
-            try:
-                output = subprocess.check_output(cmd).decode()
-            except subprocess.CalledProcessError:
-                output = ""
-
-            if pkg_name not in output:
-                not_found.append(pkg_name)
-                logging.error("Package %s...NOT FOUND!", pkg_name)
-
-            percent = (index + 1) / num_pkgs
-            self.events.add('percent', percent)
+
+        try:
+            pacman = pac.Pac(self.settings.get('pacman_config_file'), self.events.queue)
+        except Exception as ex:
+            template = (
+                "Can't initialize pyalpm. An exception of type {0} occured. Arguments:\n{1!r}")
+            message = template.format(type(ex).__name__, ex.args)
+            logging.error(message)
+            raise InstallError(message)
+
+        try:
+            not_found = pacman.get_missing_packages(self.packages)
+        finally:
+            pacman.release()
+            del pacman
+
+        for pkg_name in not_found:
+            logging.error("Package %s...NOT FOUND!", pkg_name)
+
+        self.events.add('percent', 1)
 
         if not_found:
             txt = _("Cannot find these packages: {}").format(', '.join(not_found))
             raise misc.InstallError(txt)
 
-
     def cleanup_packages_list(self):
         """ Cleans up a bit our packages list """
         # Remove duplicates
@@ -34,6 +34,8 @@ import zipfile
 
 import requests
 
+from download import download_session
+
 
 class GnomeExtensionsDownloader():
     """ Class used to download gnome extensions """
@@ -70,13 +72,16 @@ class GnomeExtensionsDownloader():
 
         # Download the extension
         if self.extension_download_link and self.extension_name:
-            req = requests.get(self.extension_download_link, stream=True)
-            if req.status_code == requests.codes.ok:
-                with open(self.tmp_downloads + self.extension_name, 'wb') as extension_file:
-                    for data in req.iter_content(1024):
-                        if not data:
-                            break
-                        extension_file.write(data)
+            with download_session.get(self.extension_download_link, stream=True) as req:
+                download_ok = req.status_code == requests.codes.ok
+                if download_ok:
+                    with open(self.tmp_downloads + self.extension_name, 'wb') as extension_file:
+                        for data in req.iter_content(1024):
+                            if not data:
+                                break
+                            extension_file.write(data)
+
+            if download_ok:
                 self.extract_extension()
 
                 return True
@@ -90,15 +95,16 @@ class GnomeExtensionsDownloader():
 
     def get_extension_info(self):
         """ Request for the complete information about the current GShell extension """
-        req = requests.get(self.extension_info_url + self.extension_name, stream=True)
-        if req.status_code == requests.codes.ok:
-            logging.debug(
-                "We got the info for the gnome extension '%s'", self.extension_name)
-            return req.json()
-        else:
-            logging.debug(
-                "Requesting the extension info failed for '%s'", self.extension_name)
-            return False
+        with download_session.get(
+                self.extension_info_url + self.extension_name, stream=True) as req:
+            if req.status_code == requests.codes.ok:
+                logging.debug(
+                    "We got the info for the gnome extension '%s'", self.extension_name)
+                return req.json()
+            else:
+                logging.debug(
+                    "Requesting the extension info failed for '%s'", self.extension_name)
+                return False
 
     def get_latest_shell_supported(self):
         """ Get the latest GShell supported version of the current extension """
@@ -114,14 +120,14 @@ class GnomeExtensionsDownloader():
                   self.extension_name + \
                   "&shell_version=" + \
                   self.extension_latest_shell
-        req = requests.get(req_url, stream=True)
-        if req.status_code == requests.codes.ok:
-            logging.debug("We got the download link for '%s'", self.extension_name)
-            return self.config.gnome_extensions_url + req.json()['download_url']
-        else:
-            logging.debug(
-                "Requesting the extension download link failed for '%s'", self.extension_name)
-            return False
+        with download_session.get(req_url, stream=True) as req:
+            if req.status_code == requests.codes.ok:
+                logging.debug("We got the download link for '%s'", self.extension_name)
+                return self.config.gnome_extensions_url + req.json()['download_url']
+            else:
+                logging.debug(
+                    "Requesting the extension download link failed for '%s'", self.extension_name)
+                return False
 
     def extract_extension(self):
         """ Extract ZIP to the final destination """
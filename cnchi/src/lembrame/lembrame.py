@@ -47,6 +47,7 @@ import libnacl.utils
 from lembrame.config import LembrameConfig
 from lembrame.gnome_extensions.downloader import GnomeExtensionsDownloader
 
+from download import download_session
 import misc.gsettings as gsettings
 from misc.run_cmd import chroot_call
 from misc.extra import InstallError
@@ -89,16 +90,16 @@ class Lembrame:
     def download_file(self):
         """ Download the lembrame encrypted file """
         if self.request_download_link():
-            req = requests.get(self.download_link, stream=True)
-            if req.status_code == requests.codes.ok:
-                with open(self.config.file_path, 'wb') as encrypted_file:
-                    for data in req.iter_content(1024):
-                        if not data:
-                            break
-                        encrypted_file.write(data)
-                return True
-            else:
-                raise InstallError(_("Downloading the Lembrame encrypted file failed"))
+            with download_session.get(self.download_link, stream=True) as req:
+                if req.status_code == requests.codes.ok:
+                    with open(self.config.file_path, 'wb') as encrypted_file:
+                        for data in req.iter_content(1024):
+                            if not data:
+                                break
+                            encrypted_file.write(data)
+                    return True
+                else:
+                    raise InstallError(_("Downloading the Lembrame encrypted file failed"))
         else:
             return False
 
@@ -108,7 +109,7 @@ class Lembrame:
 
         logging.debug("Requesting download link for uid: %s", self.credentials.user_id)
 
-        req = requests.post(self.config.request_download_endpoint, json=payload)
+        req = download_session.post(self.config.request_download_endpoint, json=payload)
         if req.status_code == requests.codes.ok:
             self.download_link = req.json()['data']
             logging.debug("API responded with a download link")
@@ -38,6 +38,8 @@ import desktop_info
 import info
 import misc.extra as misc
 
+from download import offline_bundle
+
 import pages.welcome
 import pages.language
 import pages.location
@@ -118,6 +120,16 @@ class MainWindow(Gtk.ApplicationWindow):
         if cmd_line.cache and cmd_line.cache not in xz_cache:
             xz_cache.append(cmd_line.cache)
 
+        # Offline bundle (its packages are used as a xz cache)
+        if cmd_line.offline_bundle:
+            bundle = offline_bundle.OfflineBundle(cmd_line.offline_bundle)
+            if bundle.is_valid():
+                self.settings.set('offline_bundle', bundle.path)
+                xz_cache.append(bundle.pkg_dir)
+            else:
+                logging.warning(
+                    "%s is not a valid offline bundle", cmd_line.offline_bundle)
+
         # Log cache dirs
         for xz_path in xz_cache:
             logging.debug(
@@ -127,6 +139,13 @@ class MainWindow(Gtk.ApplicationWindow):
         # Store cache dirs in config
         self.settings.set('xz_cache', xz_cache)
 
+        # LAN package caches (pacserve)
+        if cmd_line.lan_cache:
+            self.settings.set('peer_cache_servers', cmd_line.lan_cache)
+
+        # Install packages as soon as they (and their dependencies) are downloaded
+        self.settings.set('pipelined_install', cmd_line.pipelined_install)
+
         data_dir = self.settings.get('data')
 
         # For things we are not ready for users to test
@@ -32,13 +32,35 @@ import inspect
 import queue
 import logging
 import sys
+import threading
+import time
+
+from collections import OrderedDict
 
 class Events():
     """ Class that will store events, log them and show them to the user """
-    def __init__(self, callback_queue):
+
+    # Events where only the last value matters (progress info). In
+    # coalesce mode these are sent together, at most once per flush interval
+    COALESCED_EVENTS = [
+        'percent', 'downloads_percent', 'progress_bar_show_text',
+        'downloads_progress_bar_show_text']
+
+    # Default flush interval (seconds)
+    FLUSH_INTERVAL = 0.1
+
+    def __init__(self, callback_queue, coalesce=False, flush_interval=FLUSH_INTERVAL):
         self.queue = callback_queue
         self.last_event = {}
 
+        self.coalesce = coalesce and callback_queue is not None
+        self.flush_interval = flush_interval
+        # Coalesced events waiting to be sent (latest value wins)
+        self.pending = OrderedDict()
+        self.flush_timer = None
+        self.last_flush = 0
+        self.lock = threading.RLock()
+
     def add(self, event_type, event_text=""):
         """ Queues events to the event list in the GUI thread """
 
@@ -51,34 +73,75 @@ class Events():
                 msg = "{} cannot be converted to a float number".format(event_text)
                 logging.warning(msg)
 
-        if event_type in self.last_event:
-            if self.last_event[event_type] == event_text:
-                # Do not enqueue the same event twice
+        with self.lock:
+            if event_type in self.last_event:
+                if self.last_event[event_type] == event_text:
+                    # Do not enqueue the same event twice
+                    return
+
+            self.last_event[event_type] = event_text
+
+            if self.coalesce and event_type in Events.COALESCED_EVENTS:
+                self.add_pending(event_type, event_text)
                 return
 
-        self.last_event[event_type] = event_text
-
-        if event_type == "error":
-            # Format message to show file, function, and line where the
-            # error was issued. We get the previous frame in the stack,
-            # otherwise it would be this function
-            func = inspect.currentframe().f_back.f_code
-            # Dump the message + the name of this function to the log.
-            event_text = "{0}: {1} in {2}:{3}".format(
-                event_text, func.co_name, func.co_filename, func.co_firstlineno)
-
-        if self.queue is None:
-            if event_type == 'error':
-                logging.error(event_text)
-            elif event_type == 'warning':
-                logging.warning(event_text)
+            # Send pending events first, so the order is kept
+            self.flush()
+
+            if event_type == "error":
+                # Format message to show file, function, and line where the
+                # error was issued. We get the previous frame in the stack,
+                # otherwise it would be this function
+                func = inspect.currentframe().f_back.f_code
+                # Dump the message + the name of this function to the log.
+                event_text = "{0}: {1} in {2}:{3}".format(
+                    event_text, func.co_name, func.co_filename, func.co_firstlineno)
+
+            if self.queue is None:
+                if event_type == 'error':
+                    logging.error(event_text)
+                elif event_type == 'warning':
+                    logging.warning(event_text)
+                else:
+                    logging.debug(event_text)
             else:
-                logging.debug(event_text)
-        else:
-            try:
-                self.queue.put_nowait((event_type, event_text))
-            except queue.Full:
-                logging.warning("Callback queue is full")
+                self.put((event_type, event_text))
+
+    def put(self, event):
+        """ Puts an event in the callback queue """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logging.warning("Callback queue is full")
+
+    def add_pending(self, event_type, event_text):
+        """ Stores a coalesced event. It will be sent in the next flush
+            (the caller must hold the lock) """
+        self.pending[event_type] = event_text
+        elapsed = time.monotonic() - self.last_flush
+        if elapsed >= self.flush_interval:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = threading.Timer(
+                self.flush_interval - elapsed, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self):
+        """ Sends all pending coalesced events in one batch """
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not self.pending:
+                return
+            events = list(self.pending.items())
+            self.pending.clear()
+            self.last_flush = time.monotonic()
+            if len(events) == 1:
+                self.put(events[0])
+            else:
+                self.put(('batch', events))
 
     def add_fatal(self, event_text=""):
         """ Adds an error event to Cnchi event queue and quits """
@@ -28,14 +28,16 @@ from __future__ import print_function
 import os
 import datetime
 import time
-import hashlib
 import logging
 
 from xml.dom.minidom import parse
 
 from gi.repository import GObject, GLib
 
+from download import checksum
+
 TZ_DATA_FILE = '/usr/share/zoneinfo/zone.tab'
+ZONEINFO_DIR = '/usr/share/zoneinfo'
 ISO_3166_FILE = '/usr/share/xml/iso-codes/iso_3166.xml'
 
 
@@ -245,13 +247,8 @@ class Location():
         self.latitude = _parse_position(latitude, 2)
         self.longitude = _parse_position(longitude, 3)
 
-        # Calculate the sha256 sum of the timezone file for later comparison
-        try:
-            zone_path = os.path.join('/usr/share/zoneinfo', self.zone)
-            with open(zone_path, 'rb') as tz_file:
-                self.sha256sum = hashlib.sha256(tz_file.read()).digest()
-        except IOError:
-            self.sha256sum = None
+        # sha256 sum of the timezone file (only calculated when needed)
+        self._sha256sum = False
 
         try:
             today = datetime.datetime.today()
@@ -268,6 +265,30 @@ class Location():
         self.zone_letters = self.info.tzname_letters(today)
         self.isdst = self.info.is_dst(today)
 
+    @property
+    def zone_path(self):
+        """ Returns path of the timezone file """
+        return os.path.join(ZONEINFO_DIR, self.zone)
+
+    @property
+    def sha256sum(self):
+        """ sha256 sum of the timezone file (for later comparison) """
+        if self._sha256sum is False:
+            try:
+                self._sha256sum = checksum.get_file_hash(self.zone_path, 'sha256')
+            except IOError:
+                self._sha256sum = None
+        return self._sha256sum
+
+    @sha256sum.setter
+    def sha256sum(self, value):
+        self._sha256sum = value
+
+    @property
+    def needs_hash(self):
+        """ True if the sha256 sum has not been calculated yet """
+        return self._sha256sum is False
+
     def get_property(self, prop):
         """ Get object property (see above) """
         return getattr(self, prop)
@@ -310,14 +331,14 @@ class Database():
             # we check if the timezone is known.  If it isn't, we search for
             # one with the same sha256 sum and make a reference to it
             try:
-                zone_path = os.path.join('/usr/share/zoneinfo', timezone)
-                with open(zone_path, 'rb') as tz_file:
-                    sha256sum = hashlib.sha256(tz_file.read()).digest()
-
-                for loc in self.locations:
-                    if sha256sum == loc.sha256sum:
-                        self.tz_to_loc[timezone] = loc
-                        return loc
+                zone_path = os.path.join(ZONEINFO_DIR, timezone)
+                sha256sum = checksum.get_file_hash(zone_path, 'sha256')
+                if sha256sum:
+                    self.hash_locations()
+                    for loc in self.locations:
+                        if sha256sum == loc.sha256sum:
+                            self.tz_to_loc[timezone] = loc
+                            return loc
             except IOError:
                 pass
 
@@ -326,6 +347,16 @@ class Database():
             self.tz_to_loc[timezone] = None  # save it for the future
             return None
 
+    def hash_locations(self):
+        """ Calculates sha256 sums of all timezone files at once """
+        pending = [loc for loc in self.locations if loc.needs_hash]
+        if not pending:
+            return
+        hashes = checksum.hash_files([loc.zone_path for loc in pending])
+        for loc in pending:
+            sums = hashes.get(loc.zone_path)
+            loc.sha256sum = sums['sha256'] if sums else None
+
     def get_locations(self):
         """ Return all locations """
         return self.locations
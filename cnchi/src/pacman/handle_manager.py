@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  handle_manager.py
+#
+#  Copyright © 2013-2018 Antergos
+#
+#  This file is part of Cnchi.
+#
+#  Cnchi is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Cnchi is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  The following additional terms are in effect as per Section 7 of the license:
+#
+#  The preservation of all legal notices and author attributions in
+#  the material or in the Appropriate Legal Notices displayed
+#  by works containing it is required.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Keeps initialised alpm handles alive, so each installer phase does
+    not have to parse pacman.conf and load the databases again """
+
+import logging
+import os
+import threading
+
+import pacman.pacman_conf as config
+import pacman.satisfier_index as satisfier_index
+
+try:
+    import pyalpm
+except ImportError as err:
+    # This is already logged elsewhere
+    # logging.error(err)
+    pass
+
+
+class HandleManager():
+    """ Stores one initialised alpm handle for each (pacman.conf path,
+        root dir, db path), and its package index. Handles must be
+        invalidated when their databases are replaced on disk """
+
+    def __init__(self):
+        # conf_path -> (stamp, PacmanConfig)
+        self.configs = {}
+        # (conf_path, root_dir, db_path) -> handle
+        self.handles = {}
+        # (conf_path, root_dir, db_path) -> satisfier_index.HandleIndex
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_stamp(conf_path):
+        """ Returns modification time and size of a pacman.conf file """
+        stat = os.stat(conf_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_config(self, conf_path):
+        """ Returns parsed pacman.conf (it is only parsed again if the
+            file has changed). The caller must hold the lock """
+        stamp = self.get_stamp(conf_path)
+        cached = self.configs.get(conf_path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        pacman_config = config.PacmanConfig(conf_path)
+        self.configs[conf_path] = (stamp, pacman_config)
+
+        # pacman.conf has changed, handles created from it are not valid
+        for key in [key for key in self.handles if key[0] == conf_path]:
+            self.forget(key)
+        return pacman_config
+
+    def acquire(self, conf_path):
+        """ Returns alpm handle and parsed config of conf_path. The
+            handle is only created the first time """
+        with self.lock:
+            pacman_config = self.get_config(conf_path)
+            root_dir = pacman_config.options["RootDir"]
+            db_path = pacman_config.options["DBPath"]
+            key = (conf_path, root_dir, db_path)
+
+            handle = self.handles.get(key)
+            if handle is None:
+                handle = pyalpm.Handle(root_dir, db_path)
+                if handle is None:
+                    raise pyalpm.error
+                pacman_config.apply(handle)
+                self.handles[key] = handle
+                logging.debug(
+                    "ALPM initialised with root dir %s and db path %s", root_dir, db_path)
+            return handle, pacman_config
+
+    def get_key(self, handle):
+        """ Returns the key of a handle (None if it is not one of ours).
+            The caller must hold the lock """
+        for key, value in self.handles.items():
+            if value is handle:
+                return key
+        return None
+
+    def get_index(self, handle):
+        """ Returns the (shared) package index of a handle. It lives as
+            long as the manager keeps the handle, so a dropped handle
+            never gets the index of another one """
+        with self.lock:
+            key = self.get_key(handle)
+            if key is None:
+                # Handle has already been dropped (or it is not ours),
+                # do not keep its index
+                return satisfier_index.HandleIndex(handle)
+            index = self.indexes.get(key)
+            if index is None:
+                index = satisfier_index.HandleIndex(handle)
+                self.indexes[key] = index
+            return index
+
+    def forget(self, key):
+        """ Removes a handle (and its package index). The caller must hold the lock """
+        self.handles.pop(key, None)
+        self.indexes.pop(key, None)
+
+    def invalidate(self, handle):
+        """ Forgets handle (its databases have changed on disk). Next
+            acquire will create a new one """
+        with self.lock:
+            for key in [key for key, value in self.handles.items() if value is handle]:
+                self.forget(key)
+
+    def invalidate_all(self):
+        """ Forgets all handles """
+        with self.lock:
+            for key in list(self.handles):
+                self.forget(key)
+            self.configs = {}
+
+
+# Shared manager (one for each process, handles can't be shared
+# between processes)
+_MANAGER = None
+_MANAGER_PID = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_manager():
+    """ Returns the shared handle manager """
+    global _MANAGER, _MANAGER_PID
+    with _MANAGER_LOCK:
+        if _MANAGER is None or _MANAGER_PID != os.getpid():
+            _MANAGER = HandleManager()
+            _MANAGER_PID = os.getpid()
+        return _MANAGER
@@ -31,8 +31,6 @@
 
 """ Module interface to pyalpm """
 
-from collections import OrderedDict
-
 import logging
 import os
 import sys
@@ -41,7 +39,10 @@ from misc.events import Events
 
 import pacman.alpm_include as _alpm
 import pacman.pkginfo as pkginfo
-import pacman.pacman_conf as config
+import pacman.handle_manager as handle_manager
+import pacman.satisfier_index as satisfier_index
+
+import download.sync_dbs as sync_dbs
 
 try:
     import pyalpm
@@ -57,16 +58,14 @@ except NameError as err:
     def _(message):
         return message
 
-_DEFAULT_ROOT_DIR = "/"
-_DEFAULT_DB_PATH = "/var/lib/pacman"
-
 
 class Pac():
     """ Communicates with libalpm using pyalpm """
     LOG_FOLDER = '/var/log/cnchi'
 
     def __init__(self, conf_path="/etc/pacman.conf", callback_queue=None):
-        self.events = Events(callback_queue)
+        # Alpm callbacks send lots of progress events, coalesce them
+        self.events = Events(callback_queue, coalesce=True)
 
         self.conflict_to_remove = None
 
@@ -94,7 +93,8 @@ class Pac():
             raise pyalpm.error
 
         if conf_path is not None and os.path.exists(conf_path):
-            self.config = config.PacmanConfig(conf_path)
+            self.conf_path = conf_path
+            self.config = None
             self.initialize_alpm()
             logging.debug('ALPM repository database order is: %s',
                           self.config.repo_order)
@@ -119,26 +119,23 @@ class Pac():
         """ Get pacman.conf config """
         return self.config
 
-    def initialize_alpm(self):
-        """ Set alpm setup """
-        if self.config is not None:
-            root_dir = self.config.options["RootDir"]
-            db_path = self.config.options["DBPath"]
-        else:
-            root_dir = _DEFAULT_ROOT_DIR
-            db_path = _DEFAULT_DB_PATH
-
-        self.handle = pyalpm.Handle(root_dir, db_path)
-
-        logging.debug(
-            "ALPM initialised with root dir %s and db path %s", root_dir, db_path)
-
-        if self.handle is None:
-            raise pyalpm.error
-
-        if self.config is not None:
-            self.config.apply(self.handle)
+    def get_index(self):
+        """ Returns name/provides index of this handle's packages """
+        return handle_manager.get_manager().get_index(self.handle)
 
+    def initialize_alpm(self):
+        """ Set alpm setup. Handles are shared (see handle_manager), so
+            pacman.conf is only parsed and databases are only loaded
+            the first time """
+        self.handle, self.config = handle_manager.get_manager().acquire(self.conf_path)
+        self.bind_callbacks()
+
+    def bind_callbacks(self):
+        """ Sets alpm callbacks to this object's methods. As handles are
+            shared, creating another Pac for the same pacman.conf takes
+            the callbacks (and so the events) from the previous one. That
+            is why they are bound again each time a transaction or a
+            refresh starts: the Pac that runs it gets its events """
         # Set callback functions
         # Callback used for logging
         self.handle.logcb = self.cb_log
@@ -155,14 +152,21 @@ class Pac():
         # Downloading callback
         self.handle.fetchcb = None
 
+    def reload(self):
+        """ Initializes alpm again (to load databases changed on disk) """
+        if self.handle is not None:
+            handle_manager.get_manager().invalidate(self.handle)
+        self.release()
+        self.initialize_alpm()
+
     def release(self):
-        """ Release alpm handle """
+        """ Release alpm handle (it is kept alive by the handle manager,
+            so the next Pac does not have to load the databases again) """
         if self.handle is not None:
             del self.handle
             self.handle = None
 
-    @staticmethod
-    def finalize_transaction(transaction):
+    def finalize_transaction(self, transaction):
         """ Commit a transaction """
         try:
             logging.debug("Prepare alpm transaction...")
@@ -174,6 +178,8 @@ class Pac():
             transaction.release()
             return False
         transaction.release()
+        # Installed packages have changed
+        self.get_index().invalidate_local()
         logging.debug("Alpm transaction done.")
         return True
 
@@ -182,6 +188,9 @@ class Pac():
         if options is None:
             options = {}
 
+        # This Pac gets the events of the transaction (see bind_callbacks)
+        self.bind_callbacks()
+
         transaction = None
         try:
             transaction = self.handle.init_transaction(
@@ -232,21 +241,60 @@ class Pac():
 
         return self.finalize_transaction(transaction)
 
-    def refresh(self):
-        """ Sync databases like pacman -Sy """
+    def refresh(self, offline_bundle=None, parallel=False, force=True,
+                mirror_rank=None, snapshot=None):
+        """ Sync databases like pacman -Sy. If an offline bundle is
+            given, its databases are used instead of downloading them.
+            In parallel mode, all databases are downloaded at the same
+            time (sorting mirrors with mirror_rank) and, if not forced,
+            only the ones that have changed are transferred.
+            If a databases snapshot (see download.db_snapshot) is given
+            and still fresh, its databases are copied instead of
+            downloaded. Otherwise, it is updated after the refresh """
         if self.handle is None:
             logging.error("alpm is not initialised")
             raise pyalpm.error
 
-        force = True
-        res = True
-        for database in self.handle.get_syncdbs():
-            transaction = self.init_transaction()
-            if transaction:
-                database.update(force)
-                transaction.release()
+        # This Pac gets the events of the refresh (see bind_callbacks)
+        self.bind_callbacks()
+
+        # Packages will change, index them again when needed
+        self.get_index().invalidate()
+
+        if offline_bundle:
+            repos = [database.name for database in self.handle.get_syncdbs()]
+            res = offline_bundle.install_sync_dbs(self.handle.dbpath, repos)
+            # Databases have been replaced on disk, load them again
+            self.reload()
+            return res
+
+        if snapshot and snapshot.restore(self.handle):
+            self.reload()
+            return True
+
+        if parallel:
+            downloader = sync_dbs.SyncDbDownloader(
+                self.handle.dbpath, mirror_rank=mirror_rank, force=force)
+            res = downloader.refresh(self.handle.get_syncdbs())
+            if res:
+                # Databases have been replaced on disk, load them again
+                self.reload()
             else:
-                res = False
+                logging.warning(
+                    "Can't download all databases at once, refreshing them one by one")
+
+        if not parallel or not res:
+            res = True
+            for database in self.handle.get_syncdbs():
+                transaction = self.init_transaction()
+                if transaction:
+                    database.update(force)
+                    transaction.release()
+                else:
+                    res = False
+
+        if res and snapshot:
+            snapshot.record(self.handle)
         return res
 
     def install(self, pkgs, conflicts=None, options=None):
@@ -269,48 +317,33 @@ class Pac():
         # Discard duplicates
         pkgs = list(set(pkgs))
 
-        # `alpm.handle.get_syncdbs()` returns a list (the order is important) so we
-        # have to ensure we don't clobber the priority of the repos.
-        repos = OrderedDict()
-        repo_order = []
-        db_match = [db for db in self.handle.get_syncdbs()
-                    if db.name == 'antergos']
-        antdb = OrderedDict()
-        antdb['antergos'] = db_match[0]
+        index = self.get_index()
+        antergos_index = index.get_db_index('antergos')
 
+        # pkg should be sourced from the antergos repo only.
         one_repo_groups_names = ['cinnamon', 'mate', 'mate-extra']
-        one_repo_groups = []
-        for one_repo_group_name in one_repo_groups_names:
-            grp = antdb['antergos'].read_grp(one_repo_group_name)
-            if not grp:
-                # Group does not exist
-                grp = ['None', []]
-            one_repo_groups.append(grp)
-
-        one_repo_pkgs = {pkg for one_repo_group in one_repo_groups
-                         for pkg in one_repo_group[1] if one_repo_group}
-
-        for syncdb in self.handle.get_syncdbs():
-            repo_order.append(syncdb)
-            repos[syncdb.name] = syncdb
-
-        targets = []
+        one_repo_pkgs = set()
+        if antergos_index:
+            for one_repo_group_name in one_repo_groups_names:
+                one_repo_pkgs.update(
+                    pkg.name
+                    for pkg in antergos_index.get_group_pkgs(one_repo_group_name) or [])
+
+        # name -> package
+        targets = {}
         for name in pkgs:
-            _repos = repos
-
             if name in one_repo_pkgs:
-                # pkg should be sourced from the antergos repo only.
-                _repos = antdb
-
-            result_ok, pkg = self.find_sync_package(name, _repos)
+                pkg = antergos_index.get_pkg(name)
+            else:
+                pkg = index.get_sync_pkg(name)
 
-            if result_ok:
+            if pkg is not None:
                 # Check that added package is not in our conflicts list
                 if pkg.name not in conflicts:
-                    targets.append(pkg.name)
+                    targets[pkg.name] = pkg
             else:
                 # Couldn't find the package, check if it's a group
-                group_pkgs = self.get_group_pkgs(name)
+                group_pkgs = index.get_group_pkgs(name)
                 if group_pkgs is not None:
                     # It's a group
                     for group_pkg in group_pkgs:
@@ -318,7 +351,7 @@ class Pac():
                         # Ex: connman conflicts with netctl(openresolv),
                         # which is installed by default with base group
                         if group_pkg.name not in conflicts:
-                            targets.append(group_pkg.name)
+                            targets.setdefault(group_pkg.name, group_pkg)
                 else:
                     # No, it wasn't neither a package nor a group. As we don't
                     # know if this error is fatal or not, we'll register it and
@@ -326,9 +359,7 @@ class Pac():
                     logging.error(
                         "Can't find a package or group called '%s'", name)
 
-        # Discard duplicates
-        targets = list(set(targets))
-        logging.debug(targets)
+        logging.debug(list(targets))
 
         if not targets:
             logging.error("No targets found")
@@ -347,12 +378,8 @@ class Pac():
             logging.error("Can't initialize alpm transaction")
             return False
 
-        for _index in range(0, num_targets):
-            result_ok, pkg = self.find_sync_package(targets.pop(), repos)
-            if result_ok:
-                transaction.add_pkg(pkg)
-            else:
-                logging.warning(pkg)
+        for pkg in targets.values():
+            transaction.add_pkg(pkg)
 
         return self.finalize_transaction(transaction)
 
@@ -392,63 +419,78 @@ class Pac():
 
         return self.finalize_transaction(transaction)
 
-    @staticmethod
-    def find_sync_package(pkgname, syncdbs):
-        """ Finds a package name in a list of DBs
-        :rtype : tuple (True/False, package or error message)
-        """
-        for database in syncdbs.values():
-            pkg = database.get_pkg(pkgname)
-            if pkg is not None:
-                return True, pkg
-        return False, "Package '{0}' was not found.".format(pkgname)
-
     def get_group_pkgs(self, group):
         """ Get group's packages """
-        for repo in self.handle.get_syncdbs():
-            grp = repo.read_grp(group)
-            if grp is not None:
-                _name, pkgs = grp
-                return pkgs
-        return None
+        return self.get_index().get_group_pkgs(group)
+
+    def find_sync_packages(self, pkg_names):
+        """ Looks for a list of package names in the sync dbs (in one pass,
+            using the index). Returns a dict name -> package with the ones
+            that have been found """
+        index = self.get_index()
+        pkgs = {}
+        for pkg_name in pkg_names:
+            pkg = index.get_sync_pkg(pkg_name)
+            if pkg is not None:
+                pkgs[pkg_name] = pkg
+        return pkgs
+
+    def get_missing_packages(self, pkg_names):
+        """ Returns the names of pkg_names that are neither a package nor
+            a group in the sync dbs """
+        found = self.find_sync_packages(pkg_names)
+        missing = [name for name in pkg_names if name not in found]
+        groups = self.get_index().groups
+        return [name for name in missing if name not in groups]
+
+    def get_dependency_batches(self, pkg_names, max_batches=4):
+        """ Splits a list of package names (that must include all their
+            dependencies) in batches that can be installed one after the
+            other. Each batch only depends on packages of previous batches.
+            Returns a list of lists of package names """
+        index = self.get_index()
+
+        pkgs = {}
+        for pkg_name in set(pkg_names):
+            pkg = index.get_sync_pkg(pkg_name)
+            if pkg is not None:
+                pkgs[pkg.name] = pkg
+            else:
+                logging.warning("Package '%s' was not found.", pkg_name)
+
+        return satisfier_index.get_dependency_batches(pkgs.values(), max_batches)
 
     def get_packages_info(self, pkg_names=None):
         """ Get information about packages like pacman -Si """
-        if not pkg_names:
-            pkg_names = []
+        index = self.get_index()
         packages_info = {}
         if not pkg_names:
             # Store info from all packages from all repos
-            for repo in self.handle.get_syncdbs():
-                for pkg in repo.pkgcache:
-                    packages_info[pkg.name] = pkginfo.get_pkginfo(
-                        pkg,
-                        level=2,
-                        style='sync')
+            for pkg_name, pkg in index.sync.names.items():
+                packages_info[pkg_name] = pkginfo.get_pkginfo(
+                    pkg,
+                    level=2,
+                    style='sync')
         else:
-            repos = OrderedDict((database.name, database)
-                                for database in self.handle.get_syncdbs())
             for pkg_name in pkg_names:
-                result_ok, pkg = self.find_sync_package(pkg_name, repos)
-                if result_ok:
+                pkg = index.get_sync_pkg(pkg_name)
+                if pkg is not None:
                     packages_info[pkg_name] = pkginfo.get_pkginfo(
                         pkg,
                         level=2,
                         style='sync')
                 else:
                     packages_info = {}
-                    logging.error(pkg)
+                    logging.error("Package '%s' was not found.", pkg_name)
         return packages_info
 
     def get_package_info(self, pkg_name):
         """ Get information about packages like pacman -Si """
-        repos = OrderedDict((database.name, database)
-                            for database in self.handle.get_syncdbs())
-        result_ok, pkg = self.find_sync_package(pkg_name, repos)
-        if result_ok:
+        pkg = self.get_index().get_sync_pkg(pkg_name)
+        if pkg is not None:
             info = pkginfo.get_pkginfo(pkg, level=2, style='sync')
         else:
-            logging.error(pkg)
+            logging.error("Package '%s' was not found.", pkg_name)
             info = {}
         return info
 
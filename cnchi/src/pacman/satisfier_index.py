@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  satisfier_index.py
+#
+#  Copyright © 2013-2018 Antergos
+#
+#  This file is part of Cnchi.
+#
+#  Cnchi is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Cnchi is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  The following additional terms are in effect as per Section 7 of the license:
+#
+#  The preservation of all legal notices and author attributions in
+#  the material or in the Appropriate Legal Notices displayed
+#  by works containing it is required.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Index of packages by name, provides and group, to find targets and
+    dependency satisfiers without scanning whole package caches. Also
+    sorts packages by dependency level """
+
+import re
+import threading
+
+try:
+    import pyalpm
+except ImportError as err:
+    # This is already logged elsewhere
+    # logging.error(err)
+    pass
+
+# name, comparison operator, version
+_DEP_RE = re.compile(r'^([^<>=]+)(>=|<=|=|<|>)?(.*)$')
+
+
+def parse_dep(dep):
+    """ Splits a dependency string (foo>=1.0) in name, operator and version """
+    match = _DEP_RE.match(dep.strip())
+    name, operator, version = match.groups()
+    return name, operator, version or None
+
+
+def split_provide(provide):
+    """ Splits a provide string (foo=1.0) in name and version """
+    name, _sep, version = provide.partition('=')
+    return name, version or None
+
+
+def version_satisfies(version, operator, dep_version):
+    """ Checks version against a dependency version constraint """
+    if operator is None:
+        return True
+    if version is None:
+        # Unversioned provides only satisfy unversioned dependencies
+        return False
+    cmp = pyalpm.vercmp(version, dep_version)
+    if operator == '=':
+        return cmp == 0
+    if operator == '>=':
+        return cmp >= 0
+    if operator == '<=':
+        return cmp <= 0
+    if operator == '>':
+        return cmp > 0
+    return cmp < 0
+
+
+class SatisfierIndex():
+    """ Index of a list of packages by name, by the names they provide
+        and by group. Version constraints are only evaluated when looking up """
+
+    def __init__(self, pkgs):
+        # name -> [(position, pkg, version)]
+        self.candidates = {}
+        self.names = {}
+        self.groups = {}
+        for position, pkg in enumerate(pkgs):
+            self.names.setdefault(pkg.name, pkg)
+            for group in pkg.groups:
+                self.groups.setdefault(group, []).append(pkg)
+            self.candidates.setdefault(pkg.name, []).append(
+                (position, pkg, pkg.version))
+            for provide in pkg.provides:
+                name, version = split_provide(provide)
+                self.candidates.setdefault(name, []).append(
+                    (position, pkg, version))
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_pkg(self, name):
+        """ Returns package called name (None if it does not exist) """
+        return self.names.get(name)
+
+    def get_group_pkgs(self, group):
+        """ Returns group members (None if it is not a group) """
+        return self.groups.get(group)
+
+    def find_satisfier(self, dep):
+        """ Returns the first package (in the original list order) that
+            satisfies dep, as pyalpm.find_satisfier does """
+        name, operator, dep_version = parse_dep(dep)
+        best = None
+        for position, pkg, version in self.candidates.get(name, []):
+            if best is not None and position >= best[0]:
+                continue
+            if version_satisfies(version, operator, dep_version):
+                best = (position, pkg)
+        if best:
+            return best[1]
+        return None
+
+
+class HandleIndex():
+    """ Indexes of the local db and the sync dbs of an alpm handle:
+        name -> package (first db wins, as in pacman.conf order),
+        provides -> candidates and group -> members """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self._local = None
+        self._sync = None
+        self._groups = None
+        self._dbs = {}
+        self.lock = threading.RLock()
+
+    @property
+    def local(self):
+        """ Index of installed packages """
+        with self.lock:
+            if self._local is None:
+                self._local = SatisfierIndex(self.handle.get_localdb().pkgcache)
+            return self._local
+
+    @property
+    def sync(self):
+        """ Index of the packages of all sync dbs. Packages of the
+            first dbs (in pacman.conf order) take precedence """
+        with self.lock:
+            if self._sync is None:
+                self.index_sync_dbs()
+            return self._sync
+
+    @property
+    def groups(self):
+        """ Group name -> packages of the first sync db that has it """
+        with self.lock:
+            if self._groups is None:
+                self.index_sync_dbs()
+            return self._groups
+
+    def index_sync_dbs(self):
+        """ Indexes all sync dbs in one pass (the caller must hold the lock) """
+        pkgs = []
+        self._groups = {}
+        for database in self.handle.get_syncdbs():
+            db_groups = {}
+            for pkg in database.pkgcache:
+                pkgs.append(pkg)
+                for group in pkg.groups:
+                    db_groups.setdefault(group, []).append(pkg)
+            for group, members in db_groups.items():
+                self._groups.setdefault(group, members)
+        self._sync = SatisfierIndex(pkgs)
+
+    def get_db_index(self, db_name):
+        """ Returns the index of a sync db (None if it does not exist) """
+        with self.lock:
+            if db_name not in self._dbs:
+                self._dbs[db_name] = None
+                for database in self.handle.get_syncdbs():
+                    if database.name == db_name:
+                        self._dbs[db_name] = SatisfierIndex(database.pkgcache)
+                        break
+            return self._dbs[db_name]
+
+    def find_local_satisfier(self, dep):
+        """ Returns installed package that satisfies dep """
+        return self.local.find_satisfier(dep)
+
+    def find_sync_satisfier(self, dep):
+        """ Returns first sync package (dbs in order) that satisfies dep """
+        return self.sync.find_satisfier(dep)
+
+    def get_sync_pkg(self, name):
+        """ Returns first sync package called name (dbs in order) """
+        return self.sync.get_pkg(name)
+
+    def get_group_pkgs(self, group):
+        """ Returns group members (None if it is not a group) """
+        return self.groups.get(group)
+
+    def invalidate_local(self):
+        """ Local db has changed (packages have been installed) """
+        with self.lock:
+            self._local = None
+
+    def invalidate(self):
+        """ Sync dbs have changed (refresh) """
+        with self.lock:
+            self._local = None
+            self._sync = None
+            self._groups = None
+            self._dbs = {}
+
+
+def get_strongly_connected_components(graph):
+    """ Returns the strongly connected components (sets of nodes) of graph
+        (dict node -> set of nodes it points to) using Tarjan's algorithm.
+        A component is always returned after the ones it points to """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in sorted(graph):
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        # Iterative depth first search (no recursion limit)
+        work = [(root, iter(sorted(graph[root])))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(graph[child]))))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def get_dependency_levels(pkgs):
+    """ Sorts packages by dependency level. Packages of a level only
+        depend on packages of previous levels, except the ones in a
+        dependency cycle, which share their level.
+        Returns a list of sorted lists of package names """
+    pkgs = {pkg.name: pkg for pkg in pkgs}
+
+    # Dependencies of each package (only the ones in our list)
+    candidates = SatisfierIndex(pkgs.values())
+    depends = {}
+    for name, pkg in pkgs.items():
+        depends[name] = set()
+        for dep in pkg.depends:
+            provider = candidates.find_satisfier(dep)
+            if provider and provider.name != name:
+                depends[name].add(provider.name)
+
+    # Condense cycles and level the resulting acyclic graph. Components
+    # come after their dependencies, so those already have their level
+    levels = []
+    level_of = {}
+    for component in get_strongly_connected_components(depends):
+        level = 0
+        for name in component:
+            for dep in depends[name] - component:
+                level = max(level, level_of[dep] + 1)
+        for name in component:
+            level_of[name] = level
+        if level == len(levels):
+            levels.append([])
+        levels[level].extend(component)
+
+    return [sorted(level) for level in levels]
+
+
+def get_dependency_batches(pkgs, max_batches=4):
+    """ Splits packages (that must include all their dependencies) in
+        about max_batches batches that can be installed one after the
+        other. Each batch only depends on packages of previous batches.
+        Returns a list of lists of package names """
+    pkgs = list(pkgs)
+    levels = get_dependency_levels(pkgs)
+
+    # Each transaction has its cost (hooks...), so join
+    # consecutive levels to get about max_batches batches
+    batch_size = max(1, len(pkgs) // max(1, max_batches))
+    batches = []
+    batch = []
+    for level in levels:
+        batch.extend(level)
+        if len(batch) >= batch_size:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+
+    return batches
+
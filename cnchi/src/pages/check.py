@@ -227,7 +227,10 @@ class CheckProcess(multiprocessing.Process):
         else:
             self.results['updated']  = False
 
-        if has_internet and space and not packaging_issues:
+        # Offline installs do not need an Internet connection
+        offline = bool(self.settings.get('offline_bundle'))
+
+        if (has_internet or offline) and space and not packaging_issues:
             self.results['check_all'] = True
 
 
@@ -467,7 +467,8 @@ class Mirrors(GtkBaseBox):
 
     def store_values(self):
         """ Store selected values """
-        if self.use_rankmirrors:
+        if self.use_rankmirrors and not self.settings.get('offline_bundle'):
+            # Offline installs do not use mirrors at all
             self.start_rank_mirrors()
         if self.use_listboxes:
             for listbox in self.listboxes:
@@ -206,53 +206,67 @@ class Slides(GtkBaseBox):
                 # Queue is empty, just quit.
                 return True
 
-            if event[0] == 'percent':
-                self.progress_bar.set_fraction(float(event[1]))
-            elif event[0] == 'downloads_percent':
-                self.downloads_progress_bar.set_fraction(float(event[1]))
-            elif event[0] == 'progress_bar_show_text':
-                if event[1]:
-                    self.progress_bar.set_text(event[1])
-                else:
-                    self.progress_bar.set_text("")
-            elif event[0] == 'progress_bar':
-                if event[1] == 'hide':
-                    self.progress_bar.hide()
-                elif event[1] == 'show':
-                    self.progress_bar.show()
-            elif event[0] == 'downloads_progress_bar':
-                if event[1] == 'hide':
-                    self.downloads_progress_bar.hide()
-                elif event[1] == 'show':
-                    self.downloads_progress_bar.show()
-            elif event[0] == 'pulse':
-                if event[1] == 'stop':
-                    self.stop_pulse()
-                elif event[1] == 'start':
-                    self.start_pulse()
-            elif event[0] == 'finished':
-                logging.info(event[1])
-                self.installation_finished()
-            elif event[0] == 'error':
-                self.callback_queue.task_done()
-                self.install_error(event[1])
-            elif event[0] == 'info':
-                logging.info(event[1])
-                if self.should_pulse:
-                    self.progress_bar.set_text(event[1])
-                else:
-                    self.info_label.set_markup(event[1])
-            elif event[0] == 'cache_pkgs_md5_check_failed':
-                logging.debug(
-                    'Adding %s to cache_pkgs_md5_check_failed list', event[1])
-                self.settings.set('cache_pkgs_md5_check_failed', event[1])
+            if event[0] == 'batch':
+                # Several coalesced events sent together (see misc.events)
+                for batched_event in event[1]:
+                    self.manage_event(batched_event)
             else:
-                logging.warning("Event %s not recognised. Ignoring.", event[0])
+                self.manage_event(event)
 
             self.callback_queue.task_done()
 
         return True
 
+    def manage_event(self, event):
+        """ Updates the GUI with the info of one event """
+        if event[0] == 'percent':
+            self.progress_bar.set_fraction(float(event[1]))
+        elif event[0] == 'downloads_percent':
+            self.downloads_progress_bar.set_fraction(float(event[1]))
+        elif event[0] == 'progress_bar_show_text':
+            if event[1]:
+                self.progress_bar.set_text(event[1])
+            else:
+                self.progress_bar.set_text("")
+        elif event[0] == 'downloads_progress_bar_show_text':
+            if event[1]:
+                self.downloads_progress_bar.set_text(event[1])
+            else:
+                self.downloads_progress_bar.set_text("")
+        elif event[0] == 'progress_bar':
+            if event[1] == 'hide':
+                self.progress_bar.hide()
+            elif event[1] == 'show':
+                self.progress_bar.show()
+        elif event[0] == 'downloads_progress_bar':
+            if event[1] == 'hide':
+                self.downloads_progress_bar.hide()
+            elif event[1] == 'show':
+                self.downloads_progress_bar.show()
+        elif event[0] == 'pulse':
+            if event[1] == 'stop':
+                self.stop_pulse()
+            elif event[1] == 'start':
+                self.start_pulse()
+        elif event[0] == 'finished':
+            logging.info(event[1])
+            self.installation_finished()
+        elif event[0] == 'error':
+            self.callback_queue.task_done()
+            self.install_error(event[1])
+        elif event[0] == 'info':
+            logging.info(event[1])
+            if self.should_pulse:
+                self.progress_bar.set_text(event[1])
+            else:
+                self.info_label.set_markup(event[1])
+        elif event[0] == 'cache_pkgs_md5_check_failed':
+            logging.debug(
+                'Adding %s to cache_pkgs_md5_check_failed list', event[1])
+            self.settings.set('cache_pkgs_md5_check_failed', event[1])
+        else:
+            logging.warning("Event %s not recognised. Ignoring.", event[0])
+
     def empty_queue(self):
         """ Empties messages queue """
         while not self.callback_queue.empty():
@@ -30,22 +30,21 @@
 
 """ Creates mirrorlist sorted by both latest updates and fastest connection """
 
-import http.client
 import logging
 import multiprocessing
 import os
 import queue
-import subprocess
 import threading
 import time
-import urllib.request
-import urllib.error
 
 import feedparser
 import requests
 
 import update_db
 import misc.extra as misc
+import pacman.pac as pac
+from download import download_session
+from download import mirror_history
 
 # When testing, no _() is available
 try:
@@ -106,10 +105,7 @@ class RankMirrors(multiprocessing.Process):
         # Load status data (JSON) for arch mirrors
         if not self.data['arch']:
             try:
-                req = requests.get(
-                    RankMirrors.MIRROR_STATUS['arch'],
-                    headers={'User-Agent': 'Mozilla/5.0'}
-                )
+                req = download_session.get(RankMirrors.MIRROR_STATUS['arch'])
                 self.data['arch'] = req.json()
             except requests.RequestException as err:
                 logging.warning(
@@ -156,18 +152,30 @@ class RankMirrors(multiprocessing.Process):
         return None
 
     @staticmethod
-    def get_package_version(name):
-        """ Returns pkg_name package version """
+    def get_package_versions(names):
+        """ Returns a dict with the version of each package in names
+            (False if it can't be found) """
+        versions = {name: False for name in names}
         try:
-            cmd = ["/usr/bin/pacman", "-Ss", name]
-            line = subprocess.check_output(cmd).decode().split()
-            version = line[1]
-            logging.debug(
-                '%s version is: %s (used to test mirror speed)', name, version)
-        except subprocess.CalledProcessError as err:
-            logging.warning(err)
-            version = False
-        return version
+            with misc.raised_privileges():
+                pacman = pac.Pac()
+        except Exception as err:
+            logging.warning("Can't initialize pyalpm: %s", err)
+            return versions
+
+        try:
+            for name, pkg in pacman.find_sync_packages(names).items():
+                versions[name] = pkg.version
+                logging.debug(
+                    '%s version is: %s (used to test mirror speed)', name, pkg.version)
+        finally:
+            pacman.release()
+            del pacman
+
+        for name, version in versions.items():
+            if not version:
+                logging.warning("Can't find %s package version", name)
+        return versions
 
     def sort_mirrors_by_speed(self, mirrors=None, max_threads=8):
         """ Sorts mirror list """
@@ -178,8 +186,10 @@ class RankMirrors(multiprocessing.Process):
 
         rated_mirrors = {'arch': [], 'antergos': []}
 
-        for key, value in test_packages.items():
-            test_packages[key]['version'] = self.get_package_version(value['name'])
+        versions = self.get_package_versions(
+            [value['name'] for value in test_packages.values()])
+        for value in test_packages.values():
+            value['version'] = versions[value['name']]
 
         total_num_mirrors = 0
         for key in mirrors.keys():
@@ -197,6 +207,12 @@ class RankMirrors(multiprocessing.Process):
         version = ""
         rates = {}
 
+        # Throughput measured while downloading packages in previous installs
+        xz_cache_dirs = None
+        if self.settings:
+            xz_cache_dirs = self.settings.get('xz_cache')
+        history = mirror_history.get_history(xz_cache_dirs)
+
         for repo in RankMirrors.REPOSITORIES:
             name = test_packages[repo]['name']
             version = test_packages[repo]['version']
@@ -209,15 +225,14 @@ class RankMirrors(multiprocessing.Process):
                     rate = 0
                     dtime = float('NaN')
                     if full_url:
-                        req = urllib.request.Request(url=full_url)
                         try:
                             time0 = time.time()
-                            with urllib.request.urlopen(req, None, 5) as my_file:
-                                size = len(my_file.read())
+                            with download_session.get(full_url, timeout=5) as req:
+                                req.raise_for_status()
+                                size = len(req.content)
                                 dtime = time.time() - time0
                                 rate = size / dtime
-                        except (OSError, urllib.error.HTTPError,
-                                http.client.HTTPException) as err:
+                        except (OSError, requests.RequestException) as err:
                             logging.warning("Couldn't download %s", full_url)
                             logging.warning(err)
                     q_out.put((mirror_url, full_url, rate, dtime))
@@ -283,7 +298,11 @@ class RankMirrors(multiprocessing.Process):
                 if full_url:
                     kibps = rate / 1024.0
                     logging.debug(fmt, url, kibps, dtime)
-                    rates[url] = rate
+                    if rate > 0:
+                        rates[url] = history.blend(url, rate)
+                    else:
+                        # Unreachable now, no matter how it worked before
+                        rates[url] = rate
                 q_out.task_done()
 
             # Wait for all threads to finnish (all will be finished, but...)
@@ -391,14 +410,14 @@ class RankMirrors(multiprocessing.Process):
         """ Download mirror lists from archlinux and github """
         for repo in RankMirrors.REPOSITORIES:
             url = RankMirrors.MIRRORLIST_URL[repo]
-            req = urllib.request.Request(url=url)
             try:
-                with urllib.request.urlopen(req, None, 5) as my_file:
-                    data = my_file.read()
+                with download_session.get(url, timeout=5) as req:
+                    req.raise_for_status()
+                    data = req.content
                 with misc.raised_privileges():
                     with open(RankMirrors.MIRRORLIST[repo], 'wb') as mirror_file:
                         mirror_file.write(data)
-            except (OSError, urllib.error.HTTPError, http.client.HTTPException) as err:
+            except (OSError, requests.RequestException) as err:
                 logging.warning("Couldn't download %s", url)
                 logging.warning(err)
 
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_download_scheduler.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests the download scheduler policies """
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+from download.download_scheduler import DownloadScheduler
+
+
+def get_elements():
+    """ Packages in metalink order """
+    return [
+        {'identity': 'small', 'size': '10'},
+        {'identity': 'big', 'size': '1000'},
+        {'identity': 'unknown'},
+        {'identity': 'medium', 'size': '100'},
+        {'identity': 'broken', 'size': 'n/a'}]
+
+
+def get_all(scheduler, worker_index=0):
+    """ Gets all elements using the same worker """
+    identities = []
+    while True:
+        element = scheduler.get(worker_index)
+        if element is None:
+            return identities
+        identities.append(element['identity'])
+
+
+def test_metalink_order():
+    scheduler = DownloadScheduler(get_elements(), DownloadScheduler.METALINK)
+    assert len(scheduler) == 5
+    assert get_all(scheduler) == ['small', 'big', 'unknown', 'medium', 'broken']
+    assert scheduler.get() is None
+
+
+def test_largest_first():
+    scheduler = DownloadScheduler(get_elements(), DownloadScheduler.LARGEST_FIRST)
+    identities = get_all(scheduler)
+    assert identities[:3] == ['big', 'medium', 'small']
+    # Packages without a valid size go last
+    assert sorted(identities[3:]) == ['broken', 'unknown']
+
+
+def test_unknown_policy():
+    scheduler = DownloadScheduler(get_elements(), 'random')
+    assert scheduler.policy == DownloadScheduler.LARGEST_FIRST
+
+
+def test_mixed():
+    scheduler = DownloadScheduler(
+        get_elements(), DownloadScheduler.MIXED, num_workers=2)
+    # First half of the workers take the biggest packages,
+    # the others the smallest ones
+    assert scheduler.get(0)['identity'] == 'big'
+    assert scheduler.get(1)['identity'] in ('broken', 'unknown')
+    assert scheduler.get(0)['identity'] == 'medium'
+    assert len(scheduler) == 2
+
+
+def test_mixed_one_worker():
+    scheduler = DownloadScheduler(
+        get_elements(), DownloadScheduler.MIXED, num_workers=1)
+    assert get_all(scheduler)[:3] == ['big', 'medium', 'small']
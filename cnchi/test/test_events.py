@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_events.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests events module (coalescing of progress events) """
+
+import os
+import queue
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+from misc.events import Events
+
+
+def get_events(callback_queue):
+    """ Returns all queued events """
+    events = []
+    while not callback_queue.empty():
+        events.append(callback_queue.get_nowait())
+    return events
+
+
+def test_no_coalesce():
+    callback_queue = queue.Queue()
+    events = Events(callback_queue)
+    events.add('percent', 0.1)
+    events.add('percent', 0.1)
+    events.add('percent', 0.2)
+    events.add('info', 'Downloading...')
+    # Repeated events are not sent
+    assert get_events(callback_queue) == [
+        ('percent', '0.10'),
+        ('percent', '0.20'),
+        ('info', 'Downloading...')]
+
+
+def test_coalesce():
+    callback_queue = queue.Queue()
+    # Long interval, so the timer does not flush while testing
+    events = Events(callback_queue, coalesce=True, flush_interval=60)
+    events.add('percent', 0.1)
+    events.add('percent', 0.2)
+    events.add('downloads_percent', '0.5')
+    events.add('percent', 0.3)
+    # First event is sent right away, the rest wait for the next flush
+    assert get_events(callback_queue) == [('percent', '0.10')]
+
+    # Other events flush pending ones first, so the order is kept
+    events.add('info', 'Installing...')
+    assert get_events(callback_queue) == [
+        ('batch', [('percent', '0.30'), ('downloads_percent', '0.5')]),
+        ('info', 'Installing...')]
+
+
+def test_flush_single_event():
+    callback_queue = queue.Queue()
+    events = Events(callback_queue, coalesce=True, flush_interval=60)
+    events.add('percent', 0.1)
+    events.add('percent', 0.5)
+    get_events(callback_queue)
+    events.flush()
+    assert get_events(callback_queue) == [('percent', '0.50')]
+    events.flush()
+    assert get_events(callback_queue) == []
+
+
+def test_timer_flush():
+    callback_queue = queue.Queue()
+    events = Events(callback_queue, coalesce=True, flush_interval=0.01)
+    events.add('percent', 0.1)
+    events.add('percent', 0.9)
+    assert callback_queue.get(timeout=5) == ('percent', '0.10')
+    assert callback_queue.get(timeout=5) == ('percent', '0.90')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_handle_manager.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests the alpm handle manager """
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+from pacman.handle_manager import HandleManager
+
+
+class FakeHandle():
+    """ pyalpm handle replacement """
+
+    def get_syncdbs(self):
+        return []
+
+
+def add_handle(manager, conf_path='/etc/pacman.conf'):
+    """ Stores a handle as if it had been acquired """
+    handle = FakeHandle()
+    manager.handles[(conf_path, '/', '/var/lib/pacman/')] = handle
+    return handle
+
+
+def test_index_is_shared():
+    manager = HandleManager()
+    handle = add_handle(manager)
+    index = manager.get_index(handle)
+    assert index.handle is handle
+    assert manager.get_index(handle) is index
+
+
+def test_invalidate_drops_index():
+    manager = HandleManager()
+    handle = add_handle(manager)
+    other = add_handle(manager, '/tmp/pacman.conf')
+    index = manager.get_index(handle)
+    other_index = manager.get_index(other)
+
+    manager.invalidate(handle)
+    assert not manager.indexes.get(('/etc/pacman.conf', '/', '/var/lib/pacman/'))
+    # A dropped handle is not indexed again
+    assert manager.get_index(handle) is not index
+    assert manager.get_index(handle) is not manager.get_index(handle)
+    # Other handles keep their index
+    assert manager.get_index(other) is other_index
+
+    manager.invalidate_all()
+    assert not manager.handles
+    assert not manager.indexes
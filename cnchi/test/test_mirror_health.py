@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_mirror_health.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests the mirror health tracker (circuit breaker) """
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import download.mirror_health as mirror_health
+from download.mirror_health import MirrorHealth, MirrorStats
+
+URL = 'http://mirror.example.com/core/os/x86_64/foo.pkg.tar.xz'
+OTHER_URL = 'http://other.example.com/core/os/x86_64/foo.pkg.tar.xz'
+
+
+class FakeClock():
+    """ Replaces time.monotonic """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def open_circuit(health):
+    """ Fails enough times to stop using the mirror """
+    for _attempt in range(MirrorHealth.MAX_CONSECUTIVE_ERRORS):
+        assert health.allow_request(URL)
+        health.record_failure(URL)
+
+
+def test_circuit_opens_after_consecutive_errors(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(mirror_health.time, 'monotonic', clock.monotonic)
+    health = MirrorHealth()
+    open_circuit(health)
+    assert health.mirrors['mirror.example.com'].state == MirrorStats.OPEN
+    assert not health.allow_request(URL)
+    # Other mirrors are not affected
+    assert health.allow_request(OTHER_URL)
+
+
+def test_success_resets_consecutive_errors():
+    health = MirrorHealth()
+    for _attempt in range(MirrorHealth.MAX_CONSECUTIVE_ERRORS - 1):
+        health.record_failure(URL)
+    health.record_success(URL, 1000, 1.0)
+    health.record_failure(URL)
+    assert health.allow_request(URL)
+
+
+def test_half_open_probe(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(mirror_health.time, 'monotonic', clock.monotonic)
+    health = MirrorHealth()
+    open_circuit(health)
+
+    clock.now += MirrorHealth.COOLDOWN
+    # Only one request may check if the mirror works again
+    assert health.allow_request(URL)
+    assert not health.allow_request(URL)
+
+    health.record_success(URL, 1000, 1.0)
+    assert health.mirrors['mirror.example.com'].state == MirrorStats.CLOSED
+    assert health.allow_request(URL)
+    assert health.allow_request(URL)
+
+
+def test_failed_probe_doubles_cooldown(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(mirror_health.time, 'monotonic', clock.monotonic)
+    health = MirrorHealth()
+    open_circuit(health)
+
+    clock.now += MirrorHealth.COOLDOWN
+    assert health.allow_request(URL)
+    health.record_failure(URL)
+
+    stats = health.mirrors['mirror.example.com']
+    assert stats.state == MirrorStats.OPEN
+    assert stats.cooldown == 2 * MirrorHealth.COOLDOWN
+    clock.now += MirrorHealth.COOLDOWN
+    assert not health.allow_request(URL)
+    clock.now += MirrorHealth.COOLDOWN
+    assert health.allow_request(URL)
+
+
+def test_sort_urls(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(mirror_health.time, 'monotonic', clock.monotonic)
+    health = MirrorHealth()
+    fast = 'http://fast.example.com/foo'
+    slow = 'http://slow.example.com/foo'
+    health.record_success(fast, 1000000, 1.0)
+    health.record_success(slow, 1000, 1.0)
+    open_circuit(health)
+    urls = [URL, slow, fast, '']
+    # Failing mirrors and empty urls last, slow mirrors after fast ones
+    assert health.sort_urls(urls) == [fast, slow, URL, '']
+    # Unknown mirrors keep their (ranked) order
+    assert health.sort_urls([OTHER_URL, fast]) == [OTHER_URL, fast]
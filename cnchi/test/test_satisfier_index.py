@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_satisfier_index.py
+#
+# Copyright © 2013-2018 Antergos
+#
+# This file is part of Cnchi.
+#
+# Cnchi is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cnchi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The following additional terms are in effect as per Section 7 of the license:
+#
+# The preservation of all legal notices and author attributions in
+# the material or in the Appropriate Legal Notices displayed
+# by works containing it is required.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cnchi; If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests pacman's satisfier index and dependency batches """
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import pytest
+
+import pacman.satisfier_index as satisfier_index
+
+
+class FakeAlpm():
+    """ pyalpm replacement (only vercmp is needed) """
+
+    @staticmethod
+    def vercmp(version1, version2):
+        """ Compares dotted numeric versions """
+        def key(version):
+            return [int(part) for part in version.replace('-', '.').split('.')]
+        key1, key2 = key(version1), key(version2)
+        return (key1 > key2) - (key1 < key2)
+
+
+class FakePkg():
+    """ pyalpm package replacement """
+
+    def __init__(self, name, version='1.0-1', depends=(), provides=(), groups=()):
+        self.name = name
+        self.version = version
+        self.depends = list(depends)
+        self.provides = list(provides)
+        self.groups = list(groups)
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeDB():
+    """ pyalpm database replacement """
+
+    def __init__(self, name, pkgs):
+        self.name = name
+        self.pkgcache = pkgs
+
+
+class FakeHandle():
+    """ pyalpm handle replacement """
+
+    def __init__(self, syncdbs, local_pkgs=()):
+        self.syncdbs = syncdbs
+        self.localdb = FakeDB('local', list(local_pkgs))
+
+    def get_syncdbs(self):
+        return self.syncdbs
+
+    def get_localdb(self):
+        return self.localdb
+
+
+@pytest.fixture(autouse=True)
+def fake_pyalpm(monkeypatch):
+    """ Use our own vercmp """
+    monkeypatch.setattr(satisfier_index, 'pyalpm', FakeAlpm, raising=False)
+
+
+def test_parse_dep():
+    assert satisfier_index.parse_dep('glibc') == ('glibc', None, None)
+    assert satisfier_index.parse_dep('glibc>=2.28') == ('glibc', '>=', '2.28')
+    assert satisfier_index.split_provide('sh=5.0') == ('sh', '5.0')
+    assert satisfier_index.split_provide('sh') == ('sh', None)
+
+
+def test_versioned_provides():
+    old = FakePkg('libfoo-old', provides=['libfoo=1.0'])
+    new = FakePkg('libfoo-new', provides=['libfoo=2.0'])
+    index = satisfier_index.SatisfierIndex([old, new])
+    assert index.find_satisfier('libfoo') is old
+    assert index.find_satisfier('libfoo>=2.0') is new
+    assert index.find_satisfier('libfoo<2.0') is old
+    assert index.find_satisfier('libfoo>2.0') is None
+
+
+def test_unversioned_provides():
+    provider = FakePkg('bash', version='5.0-1', provides=['sh'])
+    index = satisfier_index.SatisfierIndex([provider])
+    assert index.find_satisfier('sh') is provider
+    # An unversioned provide can't satisfy a versioned dependency
+    assert index.find_satisfier('sh>=1') is None
+    # Package's own version is used for its name
+    assert index.find_satisfier('bash>=4') is provider
+    assert index.find_satisfier('bash>=6') is None
+
+
+def test_first_package_wins():
+    provider = FakePkg('mksh', provides=['sh'])
+    real = FakePkg('sh')
+    index = satisfier_index.SatisfierIndex([provider, real])
+    assert index.find_satisfier('sh') is provider
+    index = satisfier_index.SatisfierIndex([real, provider])
+    assert index.find_satisfier('sh') is real
+
+
+def test_first_db_wins():
+    core_pkg = FakePkg('foo', version='1.0-1')
+    testing_pkg = FakePkg('foo', version='2.0-1')
+    provider = FakePkg('bar', provides=['foo=3.0'])
+    handle = FakeHandle([
+        FakeDB('core', [core_pkg]),
+        FakeDB('testing', [testing_pkg, provider])])
+    index = satisfier_index.HandleIndex(handle)
+    assert index.get_sync_pkg('foo') is core_pkg
+    assert index.find_sync_satisfier('foo') is core_pkg
+    assert index.find_sync_satisfier('foo>=2.0') is testing_pkg
+    assert index.find_sync_satisfier('foo>=3.0') is provider
+    assert index.get_db_index('testing').get_pkg('foo') is testing_pkg
+    assert index.get_db_index('missing') is None
+
+
+def test_groups():
+    mate_antergos = FakePkg('mate-panel', groups=['mate'])
+    mate_community = FakePkg('mate-panel', groups=['mate'])
+    caja = FakePkg('caja', groups=['mate'])
+    xorg = FakePkg('xorg-server', groups=['xorg'])
+    handle = FakeHandle([
+        FakeDB('antergos', [mate_antergos]),
+        FakeDB('community', [mate_community, caja, xorg])])
+    index = satisfier_index.HandleIndex(handle)
+    # Members of the first db that has the group
+    assert index.get_group_pkgs('mate') == [mate_antergos]
+    assert index.get_group_pkgs('xorg') == [xorg]
+    assert index.get_group_pkgs('gnome') is None
+    community = index.get_db_index('community')
+    assert community.get_group_pkgs('mate') == [mate_community, caja]
+
+
+def test_invalidate():
+    pkg = FakePkg('foo')
+    database = FakeDB('core', [pkg])
+    handle = FakeHandle([database], local_pkgs=[pkg])
+    index = satisfier_index.HandleIndex(handle)
+    assert index.get_sync_pkg('foo') is pkg
+    assert index.find_local_satisfier('foo') is pkg
+    new_pkg = FakePkg('foo', version='2.0-1')
+    database.pkgcache = [new_pkg]
+    handle.localdb.pkgcache = []
+    index.invalidate_local()
+    assert index.find_local_satisfier('foo') is None
+    assert index.get_sync_pkg('foo') is pkg
+    index.invalidate()
+    assert index.get_sync_pkg('foo') is new_pkg
+
+
+def test_strongly_connected_components():
+    graph = {'a': {'b'}, 'b': {'a', 'c'}, 'c': set(), 'd': {'b'}}
+    components = satisfier_index.get_strongly_connected_components(graph)
+    assert sorted(map(sorted, components)) == [['a', 'b'], ['c'], ['d']]
+    # Components come after the ones they depend on
+    order = {name: position for position, component in enumerate(components)
+             for name in component}
+    assert order['c'] < order['a'] < order['d']
+
+
+def get_cycle_pkgs():
+    """ A small desktop stack with a dependency cycle """
+    return [
+        FakePkg('glibc'),
+        FakePkg('zlib', depends=['glibc']),
+        FakePkg('bash', depends=['glibc']),
+        FakePkg('freetype2', depends=['zlib', 'harfbuzz']),
+        FakePkg('harfbuzz', depends=['freetype2', 'glibc']),
+        FakePkg('gtk', depends=['freetype2', 'harfbuzz', 'sh']),
+        FakePkg('gedit', depends=['gtk']),
+        FakePkg('foo', depends=['bash', 'not-in-list']),
+        FakePkg('bar', depends=['foo', 'gtk>=1.0'])]
+
+
+def test_dependency_levels_with_cycle():
+    levels = satisfier_index.get_dependency_levels(get_cycle_pkgs())
+    assert levels == [
+        ['glibc'],
+        ['bash', 'zlib'],
+        ['foo', 'freetype2', 'harfbuzz'],
+        ['gtk'],
+        ['bar', 'gedit']]
+
+
+def test_dependency_batches_order():
+    pkgs = get_cycle_pkgs()
+    depends = {pkg.name: pkg.depends for pkg in pkgs}
+    batches = satisfier_index.get_dependency_batches(pkgs, max_batches=3)
+
+    assert sorted(name for batch in batches for name in batch) == sorted(depends)
+    assert len(batches) > 1
+    # The cycle does not drag the rest of the packages to the last batch
+    assert batches[-1] != sorted(depends)
+
+    installed = set()
+    for batch in batches:
+        available = installed | set(batch)
+        for name in batch:
+            for dep in depends[name]:
+                dep_name = satisfier_index.parse_dep(dep)[0]
+                if dep_name in depends:
+                    assert dep_name in available
+        installed.update(batch)